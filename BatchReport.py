@@ -0,0 +1,179 @@
+import matplotlib
+
+matplotlib.use("Agg")  # headless, also in every worker process
+
+import pandas as pd
+
+import LeapReport as Lr
+import LeapCache as Lch
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import logging
+import glob
+import time
+import os
+
+# Files of a session folder, after the "<starting time>_<participant id>" prefix
+SESSION_FILES = ["_leap_data.csv", "_leap_timestamps.csv", "_timestamps.csv", "_intro.csv"]
+
+
+def find_sessions(folder):
+    """
+    Returns the sessions saved by the wizard under a study folder, <drive>/<folder name>/<session>/, or the session
+    itself if folder is a session directory.
+
+            Parameters:
+                    folder (str): Study or session directory.
+
+            Returns:
+                    sessions (list of dicts): Session directory, file prefix and the path of each SESSION_FILES entry,
+                                              for the sessions that have all of them.
+    """
+
+    sessions = []
+
+    leap_data_paths = sorted(glob.glob(os.path.join(folder, "*_leap_data.csv")) +
+                             glob.glob(os.path.join(folder, "*", "*_leap_data.csv")))
+
+    for leap_data_path in leap_data_paths:
+        directory = os.path.dirname(leap_data_path)
+        prefix = os.path.basename(leap_data_path)[:-len("_leap_data.csv")]
+
+        session = {"directory": directory, "prefix": prefix}
+        session.update({suffix: os.path.join(directory, prefix + suffix) for suffix in SESSION_FILES})
+
+        missing = [suffix for suffix in SESSION_FILES if not os.path.exists(session[suffix])]
+
+        if missing:
+            logging.warning("Skipping {}, missing {}".format(directory, ", ".join(prefix + m for m in missing)))
+        else:
+            sessions.append(session)
+
+    return sessions
+
+
+def report_dir(session):
+    return os.path.join(session["directory"], "report")
+
+
+def is_up_to_date(session):
+    """
+    Returns True if the session report is newer than all of its inputs. metrics.csv is written last, so an
+    interrupted report is never up to date.
+    """
+    metrics_path = os.path.join(report_dir(session), "metrics.csv")
+
+    if not os.path.exists(metrics_path):
+        return False
+
+    return os.path.getmtime(metrics_path) > max(os.path.getmtime(session[suffix]) for suffix in SESSION_FILES)
+
+
+def get_handedness(intro_path):
+    intro = pd.read_csv(intro_path, header=None, index_col=0)[1]
+
+    return intro["handedness"].lower()
+
+
+def process_session(session, chunksize=10000, use_index=True, cache=None):
+    """
+    Creates the report of one session in its report directory, the same as the wizard does when a session ends.
+
+            Returns:
+                    seconds (float): Processing time.
+    """
+
+    start = time.perf_counter()
+
+    os.makedirs(report_dir(session), exist_ok=True)
+
+    Lr.save_report_from_csv(pd.read_csv(session["_leap_timestamps.csv"]), session["_leap_data.csv"],
+                            pd.read_csv(session["_timestamps.csv"]), get_handedness(session["_intro.csv"]),
+                            chunksize=chunksize, use_index=use_index, report_dir=report_dir(session), cache=cache,
+                            plot_workers=1)  # the sessions are already spread over the processes
+
+    return time.perf_counter() - start
+
+
+def batch_report(folder, workers=None, force=False, chunksize=10000, use_index=True, cache=None):
+    """
+    Creates the reports of every session in a study folder across a pool of processes, skipping the sessions whose
+    reports are up to date.
+
+            Parameters:
+                    folder (str): Study or session directory.
+                    workers (int): Processes in the pool, one per CPU if None.
+                    force (bool): Recreate reports that are up to date.
+                    chunksize (int): Maximum rows of leap data held in memory at a time, per process.
+                    use_index (bool): Read only the trial windows, using (and creating) the sidecar indexes.
+                    cache (LeapCache.LeapCache): Cache of the trial kinematics, shared by the processes.
+
+            Returns:
+                    failed (list of str): Session directories whose report could not be created.
+    """
+
+    logging.info("Batch report of {}".format(folder))
+
+    start = time.perf_counter()
+
+    sessions = find_sessions(folder)
+    pending = [session for session in sessions if force or not is_up_to_date(session)]
+
+    print("{} sessions, {} up to date, {} to process".format(len(sessions), len(sessions) - len(pending),
+                                                             len(pending)))
+
+    failed = []
+    seconds = []
+    size = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_session, session, chunksize, use_index, cache): session
+                   for session in pending}
+
+        for future in as_completed(futures):
+            session = futures[future]
+
+            try:
+                seconds.append(future.result())
+            except Exception as e:
+                # Reported, not swallowed, so that one bad session does not stop the rest
+                logging.error("Unable to save report for {}: {!r}".format(session["directory"], e))
+                print("FAILED {}: {!r}".format(session["directory"], e))
+                failed.append(session["directory"])
+            else:
+                size += os.path.getsize(session["_leap_data.csv"])
+                print("{:>8.2f} s {}".format(seconds[-1], session["directory"]))
+
+    total = time.perf_counter() - start
+
+    print("Processed {} sessions ({} failed) in {:.2f} s".format(len(seconds), len(failed), total))
+
+    if seconds:
+        print("\t{:.2f} sessions/s, {:.1f} MB/s of leap data, {:.2f} s per session in a worker".format(
+            len(seconds) / total, size / 2 ** 20 / total, sum(seconds) / len(seconds)))
+
+    return failed
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Creates the reports of every session in a study folder.")
+    parser.add_argument("folder", help="Study folder, <drive>/<folder name>, or a single session directory.")
+    parser.add_argument("--workers", type=int, help="Worker processes, one per CPU by default.")
+    parser.add_argument("--force", action="store_true", help="Recreate reports that are up to date.")
+    parser.add_argument("--chunksize", type=int, default=10000, help="Rows of leap data read at a time.")
+    parser.add_argument("--no-index", action="store_true", help="Stream whole csvs instead of using sidecar indexes.")
+    parser.add_argument("--cache", nargs="?", const=Lch.DEFAULT_CACHE_PATH,
+                        help="Keep the trial kinematics in a cache directory, {} if none is given.".format(
+                            Lch.DEFAULT_CACHE_PATH))
+    parser.add_argument("--cache-size", type=float, default=1024, help="Cache size cap in MB.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s:%(message)s')
+
+    cache = Lch.LeapCache(args.cache, int(args.cache_size * 2 ** 20)) if args.cache else None
+
+    failed = batch_report(args.folder, args.workers, args.force, args.chunksize, not args.no_index, cache)
+
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,431 @@
+import pandas as pd
+import numpy as np
+
+from scipy.signal import savgol_filter
+
+import Leap_utils as Lp
+import LeapFrames as Lf
+import LeapSchema as Ls
+import LeapStore as Lst
+import LeapStream as Lsm
+import LeapLoader as Ll
+import LeapIndex as Lx
+import LeapKinematics as Lk
+import LeapResample as Lrs
+import LeapReport as Lr
+import LeapVideo as Lv
+import LeapClock as Lc
+
+import argparse
+import tempfile
+import tracemalloc
+import time
+import os
+
+
+def synthetic_leap_data(seconds, rate=120.0, two_hands=False, seed=0):
+    """
+    Returns a dataframe with the same columns as a *_leap_data.csv recording, filled with a smooth random motion.
+
+            Parameters:
+                    seconds (float): Length of the recording.
+                    rate (float): Tracking frames per second.
+                    two_hands (bool): If true every frame has a right and a left hand.
+                    seed (int): Seed for the random number generator.
+
+            Returns:
+                    leap_df (pandas dataframe): Synthetic leap data.
+    """
+
+    rng = np.random.default_rng(seed)
+    columns = Ls.leap_data_columns()
+
+    n = int(seconds * rate)
+    frame_id = np.arange(n, dtype=np.int64)
+
+    # Random walk so that consecutive frames are close to each other, like a real hand.
+    data = np.cumsum(rng.normal(0, 0.5, size=(n, len(columns))), axis=0) + rng.uniform(-100, 100, len(columns))
+
+    leap_df = pd.DataFrame(data, columns=columns)
+    leap_df['frame_id'] = frame_id
+    leap_df['timestamp'] = 807978155876 + (frame_id * 10 ** 6 / rate).astype(np.int64)
+    leap_df['tracking_frame_id'] = frame_id
+    leap_df['nHands'] = 2 if two_hands else 1
+    leap_df['framerate'] = rate
+    leap_df['hand_id'] = frame_id // int(10 * rate)  # a new hand every 10 seconds
+    leap_df['hand_type'] = "right"
+
+    for digit in Ls.DIGIT_NAMES:
+        leap_df[digit + "_finger_id"] = Ls.DIGIT_NAMES.index(digit)
+        leap_df[digit + "_is_extended"] = 1
+
+    if two_hands:
+        left_df = leap_df.copy()
+        left_df['hand_id'] = left_df['hand_id'] + n
+        left_df['hand_type'] = "left"
+        leap_df = pd.concat([leap_df, left_df]).sort_values('frame_id', kind='stable').reset_index(drop=True)
+
+    return leap_df
+
+
+def timeit(function, repeat=3):
+    """
+    Returns the best wall clock time of repeat calls to function.
+    """
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def report(name, times):
+    print(name)
+    baseline = None
+    for label, seconds in times.items():
+        if baseline is None:
+            baseline = seconds
+        print("\t{:<30} {:>10.4f} s {:>8.1f}x".format(label, seconds, baseline / seconds))
+
+
+def benchmark_hand_frames(leap_df, repeat=3):
+    """
+    Compares building LEAP_HAND objects row by row against building one HandFrameArray.
+    """
+
+    def object_loop():
+        return [Lp.get_hand(row) for index, row in leap_df.iterrows()]
+
+    def columnar():
+        return Lf.HandFrameArray.from_dataframe(leap_df)
+
+    report("Hand frames ({} rows)".format(len(leap_df)),
+           {"get_hand loop": timeit(object_loop, 1),
+            "HandFrameArray": timeit(columnar, repeat)})
+
+
+def benchmark_tracking_frames(leap_df, repeat=3):
+    """
+    Compares get_tracking_event on each frame's rows against one TrackingFrames grouping and O(1) lookups.
+    """
+
+    frame_ids = leap_df['frame_id'].unique()[:200]
+
+    def per_frame():
+        return [Lp.get_tracking_event(leap_df[leap_df['frame_id'] == frame_id]) for frame_id in frame_ids]
+
+    def grouped():
+        tracking_frames = Lf.TrackingFrames.from_dataframe(leap_df)
+        return [tracking_frames.get_tracking_event(frame_id) for frame_id in frame_ids]
+
+    report("Tracking frames ({} frames)".format(len(frame_ids)),
+           {"get_tracking_event": timeit(per_frame, 1),
+            "TrackingFrames": timeit(grouped, repeat)})
+
+
+def benchmark_store(leap_df, repeat=3):
+    """
+    Compares parsing the csv against opening the columnar store, for all columns and for the report columns.
+    """
+
+    report_columns = ['timestamp', 'hand_type', 'palm_position_x', 'palm_position_y', 'palm_position_z']
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "benchmark_leap_data.csv")
+        leap_df.to_csv(csv_path, index=False)
+        Lst.convert_leap_csv(csv_path)
+
+        def store_columns():
+            store = Lst.open_leap_store(csv_path)
+            return [np.asarray(store.get_array(name)).sum() for name in report_columns]
+
+        report("Columnar store ({} rows, {} MB csv)".format(len(leap_df), os.path.getsize(csv_path) // 2 ** 20),
+               {"read_csv": timeit(lambda: pd.read_csv(csv_path), 1),
+                "read_csv usecols": timeit(lambda: pd.read_csv(csv_path, usecols=report_columns), 1),
+                "store, all columns": timeit(lambda: Lst.open_leap_store(csv_path).to_dataframe(), repeat),
+                "store, report columns": timeit(store_columns, repeat)})
+
+
+def peak_memory(function):
+    """
+    Returns the peak memory allocated while running function, in MB.
+    """
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return peak / 2 ** 20
+
+
+def benchmark_stream(leap_df, chunksize=10000):
+    """
+    Compares the peak memory of loading the whole csv against streaming it through the trial kinematics.
+    """
+
+    timestamp = leap_df['timestamp'].to_numpy() * 10 ** -6
+    trials = pd.DataFrame({'start': [timestamp[len(timestamp) // 4]], 'stop': [timestamp[len(timestamp) // 4] + 10]},
+                          index=['Visual Reach and Grasp 1'])
+
+    # Leap microseconds to the epoch seconds of the trials
+    clock = Lc.ClockSync(np.array([0, 10 ** 6]), np.array([0., 1.]))
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "benchmark_leap_data.csv")
+        leap_df.to_csv(csv_path, index=False)
+
+        print("Peak memory ({} rows)".format(len(leap_df)))
+        print("\t{:<30} {:>10.1f} MB".format("read_csv", peak_memory(lambda: pd.read_csv(csv_path))))
+        print("\t{:<30} {:>10.1f} MB".format("stream_trial_kinematics", peak_memory(
+            lambda: Lsm.stream_trial_kinematics(csv_path, trials, clock, "right", chunksize))))
+
+
+def benchmark_profiles(leap_df):
+    """
+    Reports load time and memory of each load_leap_csv profile, against an untyped pd.read_csv.
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "benchmark_leap_data.csv")
+        leap_df.to_csv(csv_path, index=False)
+
+        print("Load profiles ({} rows, {} engine)".format(len(leap_df), Ll.PARSER_ENGINE))
+
+        loaders = {"read_csv": lambda: pd.read_csv(csv_path)}
+        for profile in Ll.PROFILES:
+            loaders[profile] = lambda profile=profile: Ll.load_leap_csv(csv_path, profile)
+
+        for label, loader in loaders.items():
+            seconds = timeit(loader, 1)
+            megabytes = loader().memory_usage(deep=True).sum() / 2 ** 20
+            print("\t{:<30} {:>10.4f} s {:>8.1f} MB".format(label, seconds, megabytes))
+
+
+def benchmark_index(leap_df, repeat=3):
+    """
+    Compares reading one 10 second trial by parsing the whole csv and masking, against seeking with the index.
+    """
+
+    start = leap_df['timestamp'].iloc[len(leap_df) // 2]
+    stop = start + 10 * 10 ** 6
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "benchmark_leap_data.csv")
+        leap_df.to_csv(csv_path, index=False)
+
+        def full_read():
+            full_df = Ll.load_leap_csv(csv_path)
+            return full_df[(full_df['timestamp'] >= start) & (full_df['timestamp'] <= stop)]
+
+        report("Trial window ({} rows)".format(len(leap_df)),
+               {"load and mask": timeit(full_read, 1),
+                "build index": timeit(lambda: Lx.build_leap_index(csv_path), 1),
+                "read_window": timeit(lambda: Lx.read_window(csv_path, start, stop), repeat)})
+
+
+def benchmark_palm_kinematics(leap_df, repeat=3):
+    """
+    Times the report palm kinematics: the old row wise apply of np.linalg.norm with diff divisions, against the
+    vectorised Savitzky-Golay stage.
+    """
+
+    position_columns = Ls.vector_columns("palm_position")
+
+    def apply_path():
+        report_df = leap_df[["timestamp"] + position_columns].copy()
+        report_df['timestamp'] = report_df['timestamp'] * 10 ** -6
+        report_df['euclidean_distance'] = report_df[position_columns].apply(np.linalg.norm, axis=1)
+        d_time = report_df['timestamp'].diff().fillna(0.)
+        report_df['velocity'] = report_df['euclidean_distance'].diff().fillna(0.) / d_time
+        report_df['acceleration'] = report_df['velocity'].diff().fillna(0.) / d_time
+        report_df['euclidean_distance'] = savgol_filter(report_df['euclidean_distance'], 33, 3)
+        return report_df
+
+    def vectorised():
+        return Lk.palm_kinematics(leap_df['timestamp'].to_numpy() * 10 ** -6,
+                                  leap_df[position_columns].to_numpy(), leap_df['hand_id'].to_numpy())
+
+    print("Palm kinematics ({} rows)".format(len(leap_df)))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        baseline = timeit(apply_path, repeat)
+    print("\t{:<30} {:>10.4f} s {:>8.0f} rows/s".format("apply", baseline, len(leap_df) / baseline))
+
+    seconds = timeit(vectorised, repeat)
+    print("\t{:<30} {:>10.4f} s {:>8.0f} rows/s {:>8.1f}x".format("savgol", seconds, len(leap_df) / seconds,
+                                                                   baseline / seconds))
+
+
+def benchmark_plots(leap_df, trials=(4, 16), workers=(1, None)):
+    """
+    Times rendering the trial figures of the report, one at a time and across a process pool, with the peak memory
+    of this process.
+    """
+
+    kinematics = pd.DataFrame({"timestamp": leap_df['timestamp'].to_numpy() * 10 ** -6})
+    kinematics['euclidean_distance'], kinematics['velocity'], kinematics['acceleration'] = Lk.palm_kinematics(
+        kinematics['timestamp'].to_numpy(), leap_df[Ls.vector_columns("palm_position")].to_numpy())
+
+    # Trials of about 12 s, the length of a reach and grasp recording
+    trial_df = kinematics.iloc[:1440]
+    tone_timestamp = trial_df['timestamp'].iloc[len(trial_df) // 2]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for n_trials in trials:
+            jobs = [Lr.get_plot_job(os.path.join(directory, "{}.png".format(i)), "Trial {}".format(i), trial_df,
+                                    tone_timestamp) for i in range(n_trials)]
+
+            print("Trial plots ({} trials)".format(n_trials))
+
+            for n_workers in workers:
+                label = "one at a time" if n_workers == 1 else "pool of {}".format(n_workers or os.cpu_count())
+                start = time.perf_counter()
+                peak = peak_memory(lambda: Lr.save_plots(jobs, n_workers))
+                seconds = time.perf_counter() - start
+                print("\t{:<30} {:>10.4f} s {:>8.2f} plots/s {:>8.1f} MB peak".format(label, seconds,
+                                                                                     n_trials / seconds, peak))
+
+
+def benchmark_video(leap_df, frames=120, framerate=30):
+    """
+    Times drawing hand video frames: one reused figure writing into a preallocated BGR buffer, against the OpenCV
+    rasteriser. Each is timed with drawing and encoding one after another and in the threaded pipeline.
+    """
+
+    timestamp = leap_df['timestamp'].to_numpy(dtype=float)
+    timestamps = timestamp.min() + np.arange(frames) * 10 ** 6 / framerate
+    video_df = Lrs.resample_leap(leap_df, timestamps, "linear")
+
+    print("Hand video ({} frames)".format(frames))
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "video.mp4")
+
+        def reused(renderer, queue_size):
+            return lambda: Lv.make_leap_video(filename, framerate, video_df, timestamps, renderer=renderer,
+                                              queue_size=queue_size)
+
+        for label, function in [("reused figure", reused("matplotlib", 0)),
+                                ("reused figure, pipelined", reused("matplotlib", Lv.QUEUE_SIZE)),
+                                ("opencv rasteriser", reused("opencv", 0)),
+                                ("opencv rasteriser, pipelined", reused("opencv", Lv.QUEUE_SIZE))]:
+            seconds = timeit(function, 1)
+            print("\t{:<30} {:>10.4f} s {:>8.1f} frames/s".format(label, seconds, frames / seconds))
+
+
+def benchmark_video_workers(leap_df, frames=240, framerate=30, workers=(1, 2, 4, 8)):
+    """
+    Times make_leap_video with the frames split into segments across 1, 2, 4 and 8 processes, with each renderer.
+    Scaling stops at the number of CPUs.
+    """
+
+    timestamp = leap_df['timestamp'].to_numpy(dtype=float)
+    timestamps = timestamp.min() + np.arange(frames) * 10 ** 6 / framerate
+    video_df = Lrs.resample_leap(leap_df, timestamps, "linear")
+
+    print("Hand video in segments ({} frames, {} CPUs)".format(frames, os.cpu_count()))
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "video.mp4")
+
+        for renderer in Lv.RENDERERS:
+            for n in workers:
+                seconds = timeit(lambda: Lv.make_leap_video(filename, framerate, video_df, timestamps,
+                                                            renderer=renderer, workers=n), 1)
+                print("\t{:<12} {:>2} workers {:>10.4f} s {:>8.1f} frames/s".format(renderer, n, seconds,
+                                                                                  frames / seconds))
+
+
+def benchmark_resample(leap_df, repeat=3, minutes=(1, 10, 60), framerate=30):
+    """
+    Times resampling every column of leap_df, and of synthetic 1, 10 and 60 minute sessions, to video timestamps
+    with each resampling method. leap_df is also resampled the old way, a pandas cubic interpolate of every column
+    with the video timestamps inserted, for comparison.
+    """
+
+    sessions = [("recording", leap_df)] + [("{} min".format(m), synthetic_leap_data(m * 60)) for m in minutes]
+
+    for name, session_df in sessions:
+        timestamp = session_df['timestamp'].to_numpy(dtype=float)
+        timestamps = np.arange(timestamp.min(), timestamp.max(), 10 ** 6 / framerate)
+
+        print("Resample {} ({} rows to {} frames)".format(name, len(session_df), len(timestamps)))
+
+        for method in Lrs.METHODS:
+            seconds = timeit(lambda: Lrs.resample_leap(session_df, timestamps, method), repeat)
+            print("\t{:<30} {:>10.4f} s {:>8.0f} rows/s".format(method, seconds, len(session_df) / seconds))
+
+        if name == "recording":
+            def pandas_cubic():
+                numeric_df = session_df.select_dtypes(include='float').set_index(session_df['timestamp'])
+                inserted_df = pd.DataFrame(index=pd.Index(timestamps, name='timestamp'), columns=numeric_df.columns,
+                                           dtype=float)
+                return pd.concat([numeric_df, inserted_df]).sort_index().interpolate(method='cubic')
+
+            seconds = timeit(pandas_cubic, 1)
+            print("\t{:<30} {:>10.4f} s {:>8.0f} rows/s".format("pandas cubic", seconds, len(session_df) / seconds))
+
+    check_resample_short_hand(leap_df, framerate)
+
+
+def check_resample_short_hand(leap_df, framerate=30, samples=20):
+    """
+    Resamples leap_df with the report kinematics after a hand is lost and found again for fewer samples than the
+    Savitzky-Golay window, as save_report does for its videos. The derivatives of the short hand are NaN, and must
+    stay NaN in its frames rather than make the fit fail, while the other hands are resampled as before.
+    """
+
+    leap_df = leap_df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+    first = len(leap_df) // 2
+
+    leap_df.loc[first:first + samples - 1, 'hand_id'] = leap_df['hand_id'].max() + 1
+
+    timestamp = leap_df['timestamp'].to_numpy() * 10 ** -6
+    leap_df['euclidean_distance'], leap_df['velocity'], leap_df['acceleration'] = Lk.palm_kinematics(
+        timestamp, leap_df[Ls.vector_columns("palm_position")].to_numpy(), leap_df['hand_id'].to_numpy())
+
+    short = leap_df['hand_id'] == leap_df['hand_id'].max()
+    timestamps = np.arange(leap_df['timestamp'].min(), leap_df['timestamp'].max(), 10 ** 6 / framerate)
+
+    print("Resample with a {} sample hand".format(samples))
+
+    for method in Lrs.METHODS:
+        resampled_df = Lrs.resample_leap(leap_df, timestamps, method)
+        in_short = resampled_df['hand_id'] == leap_df.loc[short, 'hand_id'].iloc[0]
+
+        assert resampled_df.loc[in_short, 'velocity'].isna().all()
+        assert resampled_df.loc[~in_short, 'velocity'].notna().all()
+        assert resampled_df['palm_position_x'].notna().all()
+
+        print("\t{:<30} {:>10} frames, {} in the short hand".format(method, len(resampled_df), in_short.sum()))
+
+
+BENCHMARKS = {"hand_frames": benchmark_hand_frames,
+              "tracking_frames": benchmark_tracking_frames,
+              "store": benchmark_store,
+              "stream": benchmark_stream,
+              "profiles": benchmark_profiles,
+              "index": benchmark_index,
+              "palm_kinematics": benchmark_palm_kinematics,
+              "resample": benchmark_resample,
+              "plots": benchmark_plots,
+              "video": benchmark_video,
+              "video_workers": benchmark_video_workers}
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmarks for the leap data processing.")
+    parser.add_argument("--csv", help="A *_leap_data.csv recording. Synthetic data is used if not given.")
+    parser.add_argument("--seconds", type=float, default=60, help="Length of the synthetic recording.")
+    parser.add_argument("--only", choices=sorted(BENCHMARKS), action="append", help="Benchmarks to run.")
+    args = parser.parse_args()
+
+    if args.csv:
+        leap_df = pd.read_csv(args.csv)
+    else:
+        leap_df = synthetic_leap_data(args.seconds)
+
+    for name in args.only or BENCHMARKS:
+        BENCHMARKS[name](leap_df)
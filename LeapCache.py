@@ -0,0 +1,244 @@
+import pandas as pd
+import numpy as np
+
+import hashlib
+import logging
+import json
+import os
+
+CACHE_VERSION = 2
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".reach_and_grasp_cache")
+
+# Subdirectory of the content hashes of input files, by path
+DIGEST_DIR = "digests"
+
+
+def file_digest(path, block_size=2 ** 24):
+    """
+    Returns the sha1 of a file's contents.
+    """
+    digest = hashlib.sha1()
+
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def frame_digest(df):
+    """
+    Returns a sha1 of a dataframe's index, columns and values.
+    """
+    digest = hashlib.sha1()
+    digest.update(json.dumps([str(column) for column in df.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+
+    return digest.hexdigest()
+
+
+def _column_dtype(series, array):
+    """
+    Returns the dtype to restore a cached column to: the dtype the column has in every frame with rows if they agree
+    and it is numeric, otherwise the dtype it was stored as.
+    """
+    dtypes = set(column.dtype for column in series)
+
+    if len(dtypes) == 1:
+        dtype = dtypes.pop()
+        if isinstance(dtype, np.dtype) and dtype.kind in "biuf":
+            return dtype.str
+
+    return array.dtype.str
+
+
+class LeapCache():
+    """
+    An on disk cache of derived arrays, addressed by a hash of the inputs they were computed from and the processing
+    parameters. Each entry is one .npz file. Reading an entry marks it as used, and the least recently used entries are
+    removed whenever the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=2 ** 30):
+        self.path = path
+        self.max_bytes = max_bytes
+
+        # Content hashes of files, keyed by path, size and mtime, so each file is only read once per process
+        self._digests = {}
+
+        os.makedirs(os.path.join(path, DIGEST_DIR), exist_ok=True)
+
+    def _digest(self, path):
+        """
+        Returns the content hash of a file. Hashes are also kept on disk with the size and mtime of the file, so a
+        file is only read again once it changes, and not on every run.
+        """
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+
+        if key in self._digests:
+            return self._digests[key]
+
+        digest_path = os.path.join(self.path, DIGEST_DIR, hashlib.sha1(key[0].encode()).hexdigest() + ".json")
+
+        try:
+            with open(digest_path) as f:
+                known = json.load(f)
+        except (FileNotFoundError, ValueError):
+            known = {}
+
+        if known.get("size") == stat.st_size and known.get("mtime") == stat.st_mtime:
+            digest = known["digest"]
+        else:
+            digest = file_digest(path)
+
+            temp_path = "{}.{}.tmp".format(digest_path, os.getpid())
+            with open(temp_path, "w") as f:
+                json.dump({"path": key[0], "size": stat.st_size, "mtime": stat.st_mtime, "digest": digest}, f)
+            os.replace(temp_path, digest_path)
+
+        self._digests[key] = digest
+
+        return digest
+
+    def key(self, files=(), frames=(), **params):
+        """
+        Returns the cache key of a result.
+
+                Parameters:
+                        files (list of str): Input files, hashed by content.
+                        frames (list of pandas dataframes): Inputs already loaded, hashed by content.
+                        params: Processing parameters, anything json can write.
+
+                Returns:
+                        key (str): Hex digest.
+        """
+        description = {"version": CACHE_VERSION,
+                       "files": [self._digest(path) for path in files],
+                       "frames": [frame_digest(df) for df in frames],
+                       "params": params}
+
+        return hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key + ".npz")
+
+    def __contains__(self, key):
+        return os.path.exists(self.entry_path(key))
+
+    def get(self, key):
+        """
+        Returns the arrays stored under key as a dictionary, or None if there are none.
+        """
+        path = self.entry_path(key)
+
+        try:
+            with np.load(path) as entry:
+                arrays = {name: entry[name] for name in entry.files}
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+        try:
+            os.utime(path)  # the modification time is the last use
+        except FileNotFoundError:
+            pass  # evicted by another process since it was read
+
+        logging.info("Leap cache hit {}".format(key))
+
+        return arrays
+
+    def put(self, key, arrays):
+        """
+        Stores a dictionary of arrays under key, then evicts the least recently used entries over the size cap.
+        """
+        path = self.entry_path(key)
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+
+        # Written under another name first, so a reader never sees half an entry
+        with open(temp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(temp_path, path)
+
+        self.evict()
+
+    def get_frames(self, key):
+        """
+        Returns the dataframes stored with put_frames, as a dictionary of name to dataframe, or None.
+        """
+        arrays = self.get(key)
+
+        if arrays is None:
+            return None
+
+        names = arrays.pop("__names__")
+        part = arrays.pop("__part__")
+        columns = list(arrays.pop("__columns__"))
+        dtypes = list(arrays.pop("__dtypes__"))
+
+        data_df = pd.DataFrame({column: arrays[column].astype(dtype, copy=False)
+                                for column, dtype in zip(columns, dtypes)}, columns=columns)
+
+        return {name: data_df[part == i].reset_index(drop=True) for i, name in enumerate(names)}
+
+    def put_frames(self, key, frames):
+        """
+        Stores a dictionary of name to dataframe, all with the same numeric columns.
+        """
+        names = list(frames)
+        columns = list(frames[names[0]].columns) if names else []
+
+        data_df = pd.concat([frames[name].reindex(columns=columns) for name in names], axis=0, ignore_index=True) if names \
+            else pd.DataFrame()
+
+        arrays = {column: data_df[column].to_numpy(dtype=None if data_df[column].dtype != object else np.float64)
+                  for column in columns}
+        arrays["__names__"] = np.array(names, dtype=str)
+        arrays["__part__"] = np.repeat(np.arange(len(names)), [len(frames[name]) for name in names])
+        arrays["__columns__"] = np.array(columns, dtype=str)
+
+        # Concatenating with an empty frame makes integer columns float, so the dtype each column has in the frames
+        # with rows is kept to be restored by get_frames
+        arrays["__dtypes__"] = np.array([_column_dtype([frames[name][column] for name in names
+                                                        if len(frames[name])], arrays[column]) for column in columns],
+                                        dtype=str)
+
+        self.put(key, arrays)
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        """
+        Returns the last use, size and path of every entry.
+        """
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(".npz"):
+                path = os.path.join(self.path, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # removed by another process
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        return entries
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is within max_bytes.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # removed by another process
+
+            total -= size
+            logging.info("Leap cache evicted {}".format(os.path.basename(path)))
@@ -0,0 +1,109 @@
+import pandas as pd
+import numpy as np
+
+import logging
+
+
+def parse_system_timestamps(system_timestamps):
+    """
+    Returns epoch seconds of system timestamp strings such as "2021-09-17 16:04:50.000009", all parsed in one call.
+    The strings are taken as UTC, as the wizard writes them.
+    """
+    system_timestamps = pd.Series(system_timestamps)
+
+    try:
+        # isoformat() leaves out zero microseconds, so the rows do not share one exact format
+        datetimes = pd.to_datetime(system_timestamps, format="ISO8601")
+    except ValueError:
+        datetimes = pd.to_datetime(system_timestamps)  # pandas < 2 has no "ISO8601" format, and infers it per row
+
+    return ((datetimes - pd.Timestamp(0)) / pd.Timedelta(seconds=1)).to_numpy(dtype=np.float64)
+
+
+def theil_sen(x, y):
+    """
+    Returns the intercept and slope of the Theil-Sen line through the points: the median of the slopes between every
+    pair of points, and the median intercept for that slope. Up to about 29% of the points can be outliers.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    i, j = np.triu_indices(len(x), k=1)
+    d_x = x[j] - x[i]
+    valid = d_x != 0
+
+    slope = np.median((y[j] - y[i])[valid] / d_x[valid]) if np.any(valid) else 1.
+    intercept = np.median(y - slope * x)
+
+    return intercept, slope
+
+
+class ClockSync():
+    """
+    Maps Leap device time to epoch seconds with an offset and drift fitted to every sync pair CallbackSample.exe
+    writes to *_leap_timestamps.csv, roughly one every 31 s.
+
+    Times are measured from the first sync pair, so the fit is well conditioned: epoch = system_reference + offset +
+    rate * (leap - leap_reference) * 10 ** -6, where rate - 1 is the drift of the Leap clock.
+    """
+
+    def __init__(self, leap_timestamp, system_timestamp):
+        """
+                Parameters:
+                        leap_timestamp (array): Leap timestamps of the sync pairs, microseconds.
+                        system_timestamp (array): System timestamps of the sync pairs, epoch seconds.
+        """
+
+        leap_timestamp = np.asarray(leap_timestamp, dtype=np.float64)
+        system_timestamp = np.asarray(system_timestamp, dtype=np.float64)
+
+        if len(leap_timestamp) == 0:
+            raise ValueError("Cannot synchronise the leap clock without any sync pairs")
+
+        self.leap_reference = leap_timestamp[0]
+        self.system_reference = system_timestamp[0]
+
+        leap_seconds = (leap_timestamp - self.leap_reference) * 10 ** -6
+        system_seconds = system_timestamp - self.system_reference
+
+        if len(leap_timestamp) > 1:
+            self.offset, self.rate = theil_sen(leap_seconds, system_seconds)
+        else:
+            self.offset, self.rate = 0., 1.  # a single pair gives the offset only
+
+        self.leap_timestamp = leap_timestamp
+        self.system_timestamp = system_timestamp
+
+        self.residuals = system_seconds - (self.offset + self.rate * leap_seconds)
+        self.residual_error = np.max(np.abs(self.residuals))
+
+        logging.info("Leap clock drift {:.2f} ppm over {} sync pairs, residual error {:.3f} ms"
+                     .format(self.drift * 10 ** 6, len(leap_timestamp), self.residual_error * 10 ** 3))
+
+    @classmethod
+    def from_dataframe(cls, leap_timestamps_df):
+        """
+        Fits the clock model to *_leap_timestamps.csv data, with system_timestamp and leap_timestamp columns.
+        """
+        return cls(leap_timestamps_df['leap_timestamp'].to_numpy(),
+                   parse_system_timestamps(leap_timestamps_df['system_timestamp']))
+
+    @property
+    def drift(self):
+        return self.rate - 1
+
+    def to_epoch(self, leap_timestamp):
+        """
+        Returns epoch seconds of Leap timestamps in microseconds, any shape.
+        """
+        leap_seconds = (np.asarray(leap_timestamp, dtype=np.float64) - self.leap_reference) * 10 ** -6
+
+        return self.system_reference + self.offset + self.rate * leap_seconds
+
+    def to_leap(self, epoch):
+        """
+        Returns Leap timestamps in microseconds of epoch seconds, any shape.
+        """
+        system_seconds = np.asarray(epoch, dtype=np.float64) - self.system_reference
+
+        return self.leap_reference + (system_seconds - self.offset) / self.rate * 10 ** 6
@@ -0,0 +1,209 @@
+import numpy as np
+import logging
+
+import Leap_utils as Lp
+import LeapSchema as Ls
+
+
+def _block(leap_df, indices, shape, dtype):
+    """
+    Reads the columns at the positions in indices in one go, and reshapes them to (n_frames,) + shape. Columns that
+    were not loaded are filled with NaN.
+    """
+    if indices is None:
+        return np.full((len(leap_df),) + shape, np.nan, dtype=np.float64 if dtype in (bool, np.int64) else dtype)
+
+    return leap_df.iloc[:, np.ravel(indices)].to_numpy(dtype=dtype).reshape((len(leap_df),) + shape)
+
+
+class HandFrameArray():
+    """
+    Columnar (struct-of-arrays) representation of every hand in a leap recording.
+
+    Each row of the leap data is one tracked hand, so index i of every array refers to the same hand. Joint
+    positions are held in a single (n_frames, 5 digits, 4 bones, 2 joints, 3) array, digits ordered thumb to pinky,
+    bones metacarpal to distal and joints prev_joint then next_joint. Quaternions are stored as w, x, y, z.
+    """
+
+    # Every per-hand array, used when slicing
+    fields = ["frame_id", "timestamp", "tracking_frame_id", "nHands", "framerate", "hand_id", "hand_type",
+              "visible_time", "pinch_distance", "grab_angle", "pinch_strength", "grab_strength",
+              "palm_position", "palm_stabilized_position", "palm_velocity", "palm_normal", "palm_direction",
+              "palm_width", "palm_orientation", "arm_joints", "arm_width", "arm_rotation", "finger_id",
+              "is_extended", "joints", "bone_width", "bone_rotation"]
+
+    def __init__(self, **arrays):
+        for field in self.fields:
+            setattr(self, field, arrays[field])
+
+    @classmethod
+    def from_dataframe(cls, leap_df, dtype=np.float64, schema=None):
+        """
+        Builds the arrays for a whole recording in one vectorized pass.
+
+                Parameters:
+                        leap_df (pandas dataframe): Recorded leap data, one row per hand.
+                        dtype (numpy dtype): Floating point type of the coordinate arrays.
+                        schema (LeapSchema): Column layout of leap_df, compiled from its columns if not given.
+                                             Arrays of column groups that were not loaded are NaN.
+
+                Returns:
+                        hand_frames (HandFrameArray): Columnar hand data.
+        """
+
+        logging.info("Building hand frame array")
+
+        if schema is None:
+            schema = Ls.LeapSchema.from_dataframe(leap_df, required=Ls.skeleton_columns())
+
+        arrays = {}
+
+        for name in Ls.FRAME_COLUMNS + Ls.HAND_COLUMNS:
+            if name in schema.frame or name in schema.hand:
+                arrays[name] = leap_df[name].to_numpy()
+            else:
+                arrays[name] = np.full(len(leap_df), None if name == "hand_type" else np.nan)
+
+        for vector, indices in schema.palm.items():
+            arrays["palm_" + vector] = _block(leap_df, indices, (3,), dtype)
+        arrays["palm_width"] = _block(leap_df, schema.palm_width, (), dtype)
+        arrays["palm_orientation"] = _block(leap_df, schema.palm_orientation, (4,), dtype)
+
+        arrays["arm_joints"] = _block(leap_df, schema.arm_joints, (2, 3), dtype)
+        arrays["arm_width"] = _block(leap_df, schema.arm_width, (), dtype)
+        arrays["arm_rotation"] = _block(leap_df, schema.arm_rotation, (4,), dtype)
+
+        arrays["finger_id"] = _block(leap_df, schema.finger_id, (5,), np.int64)
+        arrays["is_extended"] = _block(leap_df, schema.is_extended, (5,), bool)
+
+        arrays["joints"] = _block(leap_df, schema.joints, (5, 4, 2, 3), dtype)
+        arrays["bone_width"] = _block(leap_df, schema.bone_width, (5, 4), dtype)
+        arrays["bone_rotation"] = _block(leap_df, schema.bone_rotation, (5, 4, 4), dtype)
+
+        return cls(**arrays)
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __getitem__(self, item):
+        """
+        Slicing returns a new HandFrameArray. Basic slices share memory with this one.
+        """
+        return HandFrameArray(**{field: getattr(self, field)[item] for field in self.fields})
+
+    def _vector(self, array):
+        return Lp.LEAP_VECTOR(array[0], array[1], array[2])
+
+    def _quaternion(self, array):
+        return Lp.LEAP_QUARTERNION(w=array[0], x=array[1], y=array[2], z=array[3])
+
+    def _bone(self, joints, width, rotation):
+        return Lp.LEAP_BONE(self._vector(joints[0]), self._vector(joints[1]), width, self._quaternion(rotation))
+
+    def get_hand(self, i):
+        """
+        Returns hand i as a LEAP_HAND, for code written against the object API such as Leap_utils.plot_hand.
+        """
+
+        palm = Lp.LEAP_PALM(self._vector(self.palm_position[i]),
+                            self._vector(self.palm_stabilized_position[i]),
+                            self._vector(self.palm_velocity[i]),
+                            self._vector(self.palm_normal[i]),
+                            self.palm_width[i],
+                            self._vector(self.palm_direction[i]),
+                            self._quaternion(self.palm_orientation[i]))
+
+        arm = self._bone(self.arm_joints[i], self.arm_width[i], self.arm_rotation[i])
+
+        digits = []
+        for d in range(len(Ls.DIGIT_NAMES)):
+            bones = [self._bone(self.joints[i, d, b], self.bone_width[i, d, b], self.bone_rotation[i, d, b])
+                     for b in range(len(Ls.BONE_NAMES))]
+            digits.append(Lp.LEAP_DIGIT(self.finger_id[i, d], self.is_extended[i, d], *bones))
+
+        return Lp.LEAP_HAND(self.hand_type[i], self.visible_time[i], self.pinch_distance[i], self.grab_angle[i],
+                            self.pinch_strength[i], self.grab_strength[i], palm, arm, *digits)
+
+    def hands(self):
+        for i in range(len(self)):
+            yield self.get_hand(i)
+
+
+class TrackingFrames():
+    """
+    Groups the hands of a recording by frame_id, once, so that every tracking frame can be looked up in O(1).
+
+    The hands are sorted by frame_id and the boundaries between frames are found from the sorted array, so each
+    frame is a contiguous slice of the underlying HandFrameArray. Another field, e.g. timestamp, can be the key
+    instead.
+    """
+
+    def __init__(self, hand_frames, key="frame_id"):
+
+        logging.info("Grouping hand frames by {}".format(key))
+
+        keys = getattr(hand_frames, key)
+
+        if len(keys) > 1 and np.any(keys[1:] < keys[:-1]):
+            hand_frames = hand_frames[np.argsort(keys, kind="stable")]
+            keys = getattr(hand_frames, key)
+
+        self.hand_frames = hand_frames
+        self.key = key
+
+        boundaries = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        self.starts = np.concatenate(([0], boundaries)) if len(keys) else boundaries
+        self.stops = np.concatenate((boundaries, [len(keys)])) if len(keys) else boundaries
+        self.keys = keys[self.starts]
+
+        self._positions = {value: position for position, value in enumerate(self.keys.tolist())}
+
+    @classmethod
+    def from_dataframe(cls, leap_df, schema=None, key="frame_id"):
+        return cls(HandFrameArray.from_dataframe(leap_df, schema=schema), key)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, frame_id):
+        return frame_id in self._positions
+
+    def get_slice(self, frame_id):
+        """
+        Returns the rows of hand_frames that belong to frame_id.
+        """
+        position = self._positions[frame_id]
+        return slice(self.starts[position], self.stops[position])
+
+    def get_bounds(self, frame_ids):
+        """
+        Returns the first and one past the last row of hand_frames of every frame in frame_ids, as two arrays.
+        Frames that were not tracked get an empty range, so that a whole video can be looked up at once.
+        """
+        keys = getattr(self.hand_frames, self.key)
+
+        return np.searchsorted(keys, frame_ids, side='left'), np.searchsorted(keys, frame_ids, side='right')
+
+    def get_hands(self, frame_id):
+        """
+        Returns the hands of a tracking frame as a HandFrameArray view. Two hands are returned in recorded order.
+        """
+        return self.hand_frames[self.get_slice(frame_id)]
+
+    def _event(self, start, stop):
+        hands = [self.hand_frames.get_hand(i) for i in range(start, stop)]
+
+        return Lp.LEAP_TRACKING_EVENT(self.hand_frames.frame_id[start], self.hand_frames.timestamp[start],
+                                      self.hand_frames.tracking_frame_id[start], self.hand_frames.nHands[start],
+                                      hands, self.hand_frames.framerate[start])
+
+    def get_tracking_event(self, frame_id):
+        """
+        Returns the tracking frame as a LEAP_TRACKING_EVENT, with both hands if two were tracked.
+        """
+        position = self._positions[frame_id]
+        return self._event(self.starts[position], self.stops[position])
+
+    def tracking_events(self):
+        for start, stop in zip(self.starts, self.stops):
+            yield self._event(start, stop)
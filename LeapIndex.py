@@ -0,0 +1,186 @@
+import pandas as pd
+import numpy as np
+
+import LeapLoader as Ll
+
+import logging
+import os
+import io
+
+INDEX_VERSION = 1
+
+
+def index_path(csv_path):
+    """
+    Returns the sidecar index file kept next to a *_leap_data.csv file.
+    """
+    return os.path.splitext(csv_path)[0] + "_index.npz"
+
+
+def _line_starts(csv_path, block_size=2 ** 24):
+    """
+    Returns the byte offset of the start of every line in a file.
+    """
+    starts = [np.zeros(1, dtype=np.int64)]
+    position = 0
+
+    with open(csv_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord("\n"))
+            starts.append(newlines.astype(np.int64) + position + 1)
+            position += len(block)
+
+    starts = np.concatenate(starts)
+
+    return starts[starts < position]  # no line starts after the final line break
+
+
+def build_leap_index(csv_path, bucket=100000):
+    """
+    Writes a sidecar index mapping timestamp buckets, and the frame_ids in them, to byte offsets in a leap data csv.
+
+            Parameters:
+                    csv_path (str): *_leap_data.csv file, one line per row.
+                    bucket (int): Bucket width in leap microseconds.
+
+            Returns:
+                    path (str): Index file.
+    """
+
+    logging.info("Building leap data index for {}".format(csv_path))
+
+    rows = pd.read_csv(csv_path, usecols=["frame_id", "timestamp"], dtype="int64")
+    timestamp = rows['timestamp'].to_numpy()
+    frame_id = rows['frame_id'].to_numpy()
+
+    row_starts = _line_starts(csv_path)[1:]  # the first line is the header
+
+    if len(row_starts) != len(rows):
+        raise ValueError("Cannot index {}, it has {} lines but {} rows".format(csv_path, len(row_starts), len(rows)))
+
+    if np.any(np.diff(timestamp) < 0) or np.any(np.diff(frame_id) < 0):
+        raise ValueError("Cannot index {}, its rows are not in time order".format(csv_path))
+
+    # First row of every bucket. Rows are in time order, so each bucket is a contiguous byte range.
+    keys = timestamp // bucket
+    first = np.flatnonzero(np.diff(keys, prepend=keys[0] - 1)) if len(keys) else np.zeros(0, dtype=np.int64)
+
+    path = index_path(csv_path)
+
+    with open(path, "wb") as f:
+        np.savez(f,
+                 version=INDEX_VERSION,
+                 source_size=os.path.getsize(csv_path),
+                 source_mtime=os.path.getmtime(csv_path),
+                 header_size=row_starts[0] if len(row_starts) else os.path.getsize(csv_path),
+                 bucket=bucket,
+                 timestamp=timestamp[first],
+                 frame_id=frame_id[first],
+                 row=first,
+                 offset=row_starts[first])
+
+    return path
+
+
+class LeapIndex():
+    """
+    A loaded sidecar index. Each entry is the first row of a timestamp bucket: its timestamp, frame_id, row number
+    and byte offset.
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+
+        with np.load(index_path(csv_path)) as index:
+            self.version = int(index['version'])
+            self.source_size = int(index['source_size'])
+            self.source_mtime = float(index['source_mtime'])
+            self.header_size = int(index['header_size'])
+            self.bucket = int(index['bucket'])
+            self.timestamp = index['timestamp']
+            self.frame_id = index['frame_id']
+            self.row = index['row']
+            self.offset = index['offset']
+
+        self.size = os.path.getsize(csv_path)
+
+    def is_current(self):
+        return self.version == INDEX_VERSION and self.source_size == self.size and \
+            self.source_mtime == os.path.getmtime(self.csv_path)
+
+    def _byte_range(self, keys, start, stop):
+        """
+        Returns the byte range of the buckets that may hold rows with start <= key <= stop.
+        """
+        first = max(np.searchsorted(keys, start, side='right') - 1, 0)
+        last = np.searchsorted(keys, stop, side='right')
+
+        begin = self.offset[first] if len(self.offset) else self.size
+        end = self.offset[last] if last < len(self.offset) else self.size
+
+        return begin, end
+
+    def read_range(self, begin, end, profile="full"):
+        """
+        Parses the rows between two byte offsets, with the columns of a load profile.
+        """
+        with open(self.csv_path, "rb") as f:
+            header = f.read(self.header_size)
+            f.seek(begin)
+            data = f.read(max(end - begin, 0))
+
+        return pd.read_csv(io.BytesIO(header + data), **Ll.get_read_options(profile))
+
+    def read_window(self, start, stop, profile="full", exact=True):
+        """
+        Returns the rows with start <= timestamp <= stop, in leap microseconds. With exact=False the whole buckets
+        at either end are returned, which gives some samples before start to differentiate from.
+        """
+        window_df = self.read_range(*self._byte_range(self.timestamp, start, stop), profile=profile)
+
+        if exact:
+            window_df = window_df[(window_df['timestamp'] >= start) & (window_df['timestamp'] <= stop)]
+
+        return window_df
+
+    def read_frames(self, first_frame_id, last_frame_id, profile="full"):
+        """
+        Returns the rows with first_frame_id <= frame_id <= last_frame_id.
+        """
+        frames_df = self.read_range(*self._byte_range(self.frame_id, first_frame_id, last_frame_id), profile=profile)
+
+        return frames_df[(frames_df['frame_id'] >= first_frame_id) & (frames_df['frame_id'] <= last_frame_id)]
+
+
+def open_leap_index(csv_path, build=True):
+    """
+    Loads the sidecar index of a leap data csv, building it first if it is missing or out of date.
+    """
+    if os.path.exists(index_path(csv_path)):
+        index = LeapIndex(csv_path)
+        if index.is_current():
+            return index
+
+    if not build:
+        raise FileNotFoundError("No current leap index for {}".format(csv_path))
+
+    build_leap_index(csv_path)
+
+    return LeapIndex(csv_path)
+
+
+def read_window(csv_path, start, stop, profile="full"):
+    """
+    Returns the rows of a leap data csv with start <= timestamp <= stop, seeking straight to them with the sidecar
+    index.
+
+            Parameters:
+                    csv_path (str): *_leap_data.csv file.
+                    start (int): First timestamp, leap microseconds.
+                    stop (int): Last timestamp, leap microseconds.
+                    profile (str): Columns to read, see LeapLoader.PROFILES.
+
+            Returns:
+                    window_df (pandas dataframe): Leap data of the window.
+    """
+    return open_leap_index(csv_path).read_window(start, stop, profile)
@@ -0,0 +1,110 @@
+import numpy as np
+
+from scipy.signal import savgol_filter
+
+
+def _norm(vectors):
+    return np.sqrt(np.einsum('...i,...i->...', vectors, vectors))
+
+
+def _segment_bounds(segments):
+    """
+    Returns the start and stop of each run of equal values in segments.
+    """
+    boundaries = np.flatnonzero(segments[1:] != segments[:-1]) + 1
+
+    return zip(np.concatenate(([0], boundaries)), np.concatenate((boundaries, [len(segments)])))
+
+
+def smoothed_derivatives(timestamp, values, segments=None, rate=None, window_length=33, polyorder=3):
+    """
+    Returns values smoothed, with their first and second time derivatives, using Savitzky-Golay filters.
+
+    Each segment is resampled linearly onto a uniform grid, filtered there with deriv=0, 1 and 2, and the results
+    are sampled back at the original timestamps. Repeated timestamps keep the last sample, so there is never a
+    division by a zero time step. Segments too short for a filter window get NaN derivatives.
+
+            Parameters:
+                    timestamp (array): (n,) sample times in seconds.
+                    values (array): (n, ...) samples, e.g. palm distance or (n, 3) palm positions.
+                    segments (array): (n,) segment ids, e.g. hand_id, filtered separately. One segment if None.
+                    rate (float): Grid rate in Hz, the median sample rate of each segment if None.
+                    window_length (int): Filter window in grid samples, odd.
+                    polyorder (int): Order of the fitted polynomials.
+
+            Returns:
+                    smoothed, velocity, acceleration (arrays): Same shape as values, in the units of values per
+                                                               second (squared).
+    """
+
+    timestamp = np.asarray(timestamp, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+
+    if segments is None:
+        segments = np.zeros(len(timestamp), dtype=np.int64)
+
+    smoothed = values.copy()
+    velocity = np.full(values.shape, np.nan)
+    acceleration = np.full(values.shape, np.nan)
+
+    if len(values) == 0:
+        return smoothed, velocity, acceleration
+
+    order = np.lexsort((timestamp, segments))
+    t = timestamp[order]
+    v = values[order].reshape(len(values), -1)
+    s = np.asarray(segments)[order]
+
+    for start, stop in _segment_bounds(s):
+        keep = np.concatenate((t[start + 1:stop] != t[start:stop - 1], [True]))
+        segment_time = t[start:stop][keep]
+        segment_values = v[start:stop][keep]
+
+        d_time = np.diff(segment_time)
+        segment_rate = rate or (1 / np.median(d_time) if len(d_time) else 0.)
+
+        grid = np.arange(segment_time[0], segment_time[-1] + 0.5 / segment_rate, 1 / segment_rate) \
+            if segment_rate > 0 else segment_time
+
+        if len(grid) < window_length:
+            continue
+
+        grid_values = np.stack([np.interp(grid, segment_time, column) for column in segment_values.T], axis=1)
+
+        rows = order[start:stop]
+        filtered = [savgol_filter(grid_values, window_length, polyorder, deriv=deriv, delta=1 / segment_rate, axis=0)
+                    for deriv in (0, 1, 2)]
+
+        smoothed[rows], velocity[rows], acceleration[rows] = \
+            [np.stack([np.interp(t[start:stop], grid, column) for column in f.T], axis=1).reshape(
+                (stop - start,) + values.shape[1:]) for f in filtered]
+
+    return smoothed, velocity, acceleration
+
+
+def palm_kinematics(timestamp, position, segments=None, rate=None, window_length=33, polyorder=3):
+    """
+    Returns the smoothed distance of the palm from the sensor origin, with its velocity and acceleration, in one
+    vectorised pass. See smoothed_derivatives.
+
+            Parameters:
+                    timestamp (array): (n,) sample times in seconds.
+                    position (array): (n, 3) palm positions in mm.
+                    segments (array): (n,) segment ids, e.g. hand_id.
+
+            Returns:
+                    distance (mm), velocity (mm/s), acceleration (mm/s^2) (arrays): (n,) each.
+    """
+
+    position = np.asarray(position, dtype=np.float64)
+
+    return smoothed_derivatives(timestamp, _norm(position), segments, rate, window_length, polyorder)
+
+
+def palm_speed(timestamp, position, segments=None, rate=None, window_length=33, polyorder=3):
+    """
+    Returns the speed of the palm, (n,) in mm/s, from Savitzky-Golay derivatives of each axis of its position. See
+    smoothed_derivatives.
+    """
+
+    return _norm(smoothed_derivatives(timestamp, position, segments, rate, window_length, polyorder)[1])
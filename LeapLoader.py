@@ -0,0 +1,63 @@
+import pandas as pd
+
+import LeapSchema as Ls
+
+import logging
+import time
+
+try:
+    import pyarrow  # only imported to check that the faster csv parser is available
+    PARSER_ENGINE = "pyarrow"
+except ImportError:
+    PARSER_ENGINE = "c"
+
+# Columns loaded by each profile. None loads every column.
+PROFILES = {"report": ["frame_id", "timestamp", "hand_id", "hand_type"] + Ls.vector_columns("palm_position"),
+            "video": Ls.skeleton_columns(),
+            "full": None}
+
+
+def get_profile_columns(profile):
+    """
+    Returns the columns of a profile, in file order.
+    """
+    if profile not in PROFILES:
+        raise ValueError("Unknown leap data profile '{}', expected one of {}".format(profile, sorted(PROFILES)))
+
+    columns = PROFILES[profile]
+    return Ls.leap_data_columns() if columns is None else columns
+
+
+def get_read_options(profile):
+    """
+    Returns the pd.read_csv keyword arguments of a profile: the columns to parse and their compact dtypes.
+    """
+    columns = get_profile_columns(profile)
+
+    return {"usecols": columns, "dtype": Ls.leap_data_dtypes(columns)}
+
+
+def load_leap_csv(path, profile="full"):
+    """
+    Loads a leap data csv with only the columns of a profile, using compact dtypes. The header is checked against
+    the full schema first, so an incomplete file fails before any data is parsed.
+
+            Parameters:
+                    path (str): *_leap_data.csv file.
+                    profile (str): "report" for palm kinematics, "video" for drawing hands, "full" for every column.
+
+            Returns:
+                    leap_df (pandas dataframe): Leap data, float32 measurements, int64 microsecond timestamps and
+                                                categorical hand_type.
+    """
+
+    Ls.LeapSchema.from_csv(path)
+
+    start = time.perf_counter()
+
+    leap_df = pd.read_csv(path, engine=PARSER_ENGINE, **get_read_options(profile))
+
+    logging.info("Loaded {} leap data profile from {} in {:.2f} s, {} rows, {:.1f} MB".format(
+        profile, path, time.perf_counter() - start, len(leap_df), leap_df.memory_usage(deep=True).sum() / 2 ** 20))
+
+    return leap_df
@@ -0,0 +1,123 @@
+import numpy as np
+
+# Quaternions are arrays with w, x, y, z along the last axis, the same order as the leap data columns. Every function
+# works on any number of leading axes, e.g. (n, 4) or (n, 5, 4, 4) for every bone of every frame.
+
+
+def normalize(q):
+    """
+    Returns unit quaternions. Zero quaternions stay zero.
+    """
+    q = np.asarray(q, dtype=np.float64)
+    norm = np.linalg.norm(q, axis=-1, keepdims=True)
+
+    return np.divide(q, norm, out=np.zeros_like(q), where=norm > 0)
+
+
+def conjugate(q):
+    q = np.asarray(q, dtype=np.float64)
+    return q * np.array([1., -1., -1., -1.])
+
+
+def multiply(p, q):
+    """
+    Returns the Hamilton products p * q.
+    """
+    p = np.asarray(p, dtype=np.float64)
+    q = np.asarray(q, dtype=np.float64)
+
+    pw, px, py, pz = np.moveaxis(p, -1, 0)
+    qw, qx, qy, qz = np.moveaxis(q, -1, 0)
+
+    return np.stack((pw * qw - px * qx - py * qy - pz * qz,
+                     pw * qx + px * qw + py * qz - pz * qy,
+                     pw * qy - px * qz + py * qw + pz * qx,
+                     pw * qz + px * qy - py * qx + pz * qw), axis=-1)
+
+
+def to_matrix(q):
+    """
+    Returns the rotation matrices of unit quaternions, shape (..., 3, 3).
+    """
+    w, x, y, z = np.moveaxis(normalize(q), -1, 0)
+
+    return np.stack((np.stack((1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)), axis=-1),
+                     np.stack((2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)), axis=-1),
+                     np.stack((2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)), axis=-1)),
+                    axis=-2)
+
+
+def to_euler(q):
+    """
+    Returns roll (about x), pitch (about y) and yaw (about z) in radians, shape (..., 3), for the intrinsic z-y-x
+    rotation order.
+    """
+    w, x, y, z = np.moveaxis(normalize(q), -1, 0)
+
+    roll = np.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    pitch = np.arcsin(np.clip(2 * (w * y - z * x), -1., 1.))
+    yaw = np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+
+    return np.stack((roll, pitch, yaw), axis=-1)
+
+
+def slerp(q0, q1, t):
+    """
+    Spherical linear interpolation between unit quaternions, element wise.
+
+            Parameters:
+                    q0, q1 (arrays): (..., 4) quaternions.
+                    t (array): Interpolation fractions, broadcastable to q0.shape[:-1]. 0 gives q0, 1 gives q1.
+
+            Returns:
+                    q (array): (..., 4) unit quaternions, always along the shorter arc.
+    """
+    q0 = normalize(q0)
+    q1 = normalize(q1)
+    t = np.asarray(t, dtype=np.float64)[..., np.newaxis]
+
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+
+    # q and -q are the same rotation, take the one on the near side so that the shorter arc is used
+    q1 = np.where(dot < 0, -q1, q1)
+    dot = np.abs(dot)
+
+    theta = np.arccos(np.clip(dot, -1., 1.))
+    sin_theta = np.sin(theta)
+
+    # Nearly identical rotations divide by a tiny sin(theta), linear interpolation is exact enough there
+    close = sin_theta < 1e-6
+    safe = np.where(close, 1., sin_theta)
+    w0 = np.where(close, 1 - t, np.sin((1 - t) * theta) / safe)
+    w1 = np.where(close, t, np.sin(t * theta) / safe)
+
+    return normalize(w0 * q0 + w1 * q1)
+
+
+def slerp_resample(timestamp, q, new_timestamp):
+    """
+    Resamples quaternion series at new timestamps with slerp between the neighbouring samples.
+
+            Parameters:
+                    timestamp (array): (n,) increasing sample times.
+                    q (array): (n, ..., 4) quaternions, e.g. (n, k, 4) for k rotation column groups at once.
+                    new_timestamp (array): (m,) times to resample at. Times outside the samples hold the first or
+                                           last sample.
+
+            Returns:
+                    q (array): (m, ..., 4) unit quaternions.
+    """
+    timestamp = np.asarray(timestamp, dtype=np.float64)
+    new_timestamp = np.asarray(new_timestamp, dtype=np.float64)
+    q = np.asarray(q, dtype=np.float64)
+
+    if len(timestamp) == 1:
+        return np.repeat(normalize(q), len(new_timestamp), axis=0)
+
+    i = np.clip(np.searchsorted(timestamp, new_timestamp, side='right') - 1, 0, len(timestamp) - 2)
+
+    d_time = timestamp[i + 1] - timestamp[i]
+    fraction = np.divide(new_timestamp - timestamp[i], d_time, out=np.zeros_like(d_time), where=d_time > 0)
+    fraction = np.clip(fraction, 0., 1.).reshape((-1,) + (1,) * (q.ndim - 2))
+
+    return slerp(q[i], q[i + 1], fraction)
@@ -0,0 +1,164 @@
+import numpy as np
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from mpl_toolkits.mplot3d import Axes3D  # registers the 3d projection
+import cv2
+
+import LeapSchema as Ls
+
+# Colours of Leap_utils.plot_hand, BGR
+BONE_COLOUR = (255, 0, 0)
+JOINT_COLOUR = (0, 0, 255)
+PALM_COLOUR = (180, 119, 31)  # matplotlib C0
+
+SHIFT = 4  # fractional bits of the pixel coordinates given to OpenCV, for sub pixel accuracy
+
+
+def hand_segments(joints, arm_joints):
+    """
+    Returns the line segments drawn for one hand, (24, 2, 3): the 20 bones, the arm and the three links between the
+    metacarpal heads of the fingers, see LeapSchema.HAND_SEGMENTS.
+    """
+    points = np.concatenate((joints.reshape(-1, 3), arm_joints))
+
+    return points[Ls.HAND_SEGMENTS]
+
+
+def hand_axes(fig, limits=(-300, 150), elev=125, azim=-140, axis=True):
+    """
+    Adds the 3d axes the hands are drawn on to fig: the same limits on every axis, the camera of the report videos,
+    and no grid lines or ticks.
+
+            Parameters:
+                    fig (matplotlib figure): Figure to add the axes to.
+                    limits (tuple): Axis limits, the same for x, y and z.
+                    elev, azim (float): View of the camera, as Axes3D.view_init.
+                    axis (bool): Draw the panes of the axes box behind the hands.
+
+            Returns:
+                    ax (Axes3D): The new axes.
+    """
+    ax = fig.add_subplot(111, projection='3d')
+
+    ax.set_xlim3d(*limits)
+    ax.set_ylim3d(*limits)
+    ax.set_zlim3d(*limits)
+
+    ax.view_init(elev, azim)
+
+    # Hide grid lines
+    ax.grid(False)
+
+    # Hide axes ticks
+    ax.set_xticks([])
+    ax.set_yticks([])
+    ax.set_zticks([])
+
+    if not axis:
+        ax.set_axis_off()
+
+    return ax
+
+
+class HandRasteriser():
+    """
+    Draws the tracked hands straight into a BGR frame with OpenCV, for video at far more frames per second than
+    matplotlib.
+
+    The camera is taken from a matplotlib 3d axes made by hand_axes, as the matplotlib figures are, so the hands land
+    on the same pixels. That axes is drawn once as the background of every frame. Each frame projects every joint
+    with one matrix product and draws bones, joints, palm and the outline of the hand with cv2.polylines and
+    cv2.circle. Depth order is not kept: bones are drawn first, then joints, then the palm.
+    """
+
+    def __init__(self, width=500, height=400, dpi=100, limits=(-300, 150), elev=125, azim=-140, axis=True,
+                 line_width=1.5, joint_size=4.5, palm_size=10):
+        """
+                Parameters:
+                        width, height (int): Frame size in pixels.
+                        limits (tuple): Axis limits, the same for x, y and z.
+                        elev, azim (float): View of the camera, as Axes3D.view_init.
+                        axis (bool): Draw the panes of the axes box behind the hands, as the report videos do.
+                        line_width, joint_size, palm_size (float): Bone width and marker diameters in points.
+        """
+        fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        canvas = FigureCanvasAgg(fig)
+
+        ax = hand_axes(fig, limits, elev, azim, axis)
+
+        canvas.draw()
+
+        # Data to homogeneous projected coordinates, then projected coordinates to display pixels
+        self.projection = np.array(ax.M, dtype=np.float64)
+        self.display = np.array(ax.transData.get_matrix(), dtype=np.float64)
+        self.height = height
+
+        self.background = np.empty((height, width, 3), dtype=np.uint8)
+        cv2.cvtColor(np.asarray(canvas.buffer_rgba()), cv2.COLOR_RGBA2BGR, dst=self.background)
+
+        points_to_pixels = dpi / 72
+        self.line_width = max(int(round(line_width * points_to_pixels)), 1)
+        self.joint_radius = max(int(round(joint_size * points_to_pixels / 2)), 1)
+        self.palm_radius = max(int(round(palm_size * points_to_pixels / 2)), 1)
+
+        self.frame = self.background.copy()
+
+    def project(self, points):
+        """
+        Returns the pixel coordinates (column, row) of 3d points, shape (..., 2).
+        """
+        points = np.asarray(points, dtype=np.float64)
+
+        homogeneous = np.concatenate((points, np.ones(points.shape[:-1] + (1,))), axis=-1) @ self.projection.T
+        projected = homogeneous[..., :2] / homogeneous[..., 3:]
+
+        pixels = projected @ self.display[:2, :2].T + self.display[:2, 2]
+        pixels[..., 1] = self.height - pixels[..., 1]  # display coordinates start at the bottom
+
+        return pixels
+
+    def _fixed(self, pixels):
+        return np.round(pixels * (1 << SHIFT)).astype(np.int32)
+
+    def draw_hands(self, joints, arm_joints, palm_position):
+        """
+        Draws hands on a clean frame.
+
+                Parameters:
+                        joints (array): (k, 5, 4, 2, 3) joint positions of k hands.
+                        arm_joints (array): (k, 2, 3) arm joint positions.
+                        palm_position (array): (k, 3) palm positions.
+        """
+        np.copyto(self.frame, self.background)
+
+        if len(joints) == 0:
+            return
+
+        # Every segment and palm of every hand projected in one go
+        segments = np.stack([hand_segments(joints[i], arm_joints[i]) for i in range(len(joints))])
+        segment_pixels = self.project(segments)  # (k, 24, 2, 2)
+        palm_pixels = self.project(palm_position)  # (k, 2)
+
+        for hand_pixels, palm in zip(segment_pixels, palm_pixels):
+            drawn = np.all(np.isfinite(hand_pixels), axis=(1, 2))
+
+            fixed = self._fixed(np.where(np.isfinite(hand_pixels), hand_pixels, 0.))
+
+            cv2.polylines(self.frame, list(fixed[drawn]), False, BONE_COLOUR, self.line_width, cv2.LINE_AA, SHIFT)
+
+            # The ends of every bone and the arm
+            for x, y in fixed[:21][drawn[:21]].reshape(-1, 2):
+                cv2.circle(self.frame, (int(x), int(y)), self.joint_radius << SHIFT, JOINT_COLOUR, -1, cv2.LINE_AA,
+                           SHIFT)
+
+            if np.all(np.isfinite(palm)):
+                x, y = self._fixed(palm)
+                cv2.circle(self.frame, (int(x), int(y)), self.palm_radius << SHIFT, PALM_COLOUR, -1, cv2.LINE_AA,
+                           SHIFT)
+
+    def render(self):
+        """
+        Returns the frame drawn by draw_hands, BGR. The same buffer is reused by every call.
+        """
+        return self.frame
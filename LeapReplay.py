@@ -0,0 +1,256 @@
+import matplotlib
+
+matplotlib.use("Agg")  # headless, also in the video worker processes
+
+import pandas as pd
+import numpy as np
+
+from tqdm import tqdm
+
+import LeapReport as Lr
+import LeapResample as Lrs
+import LeapStream as Lsm
+import LeapStore as Lst
+import LeapVideo as Lv
+import BatchReport as Br
+
+import argparse
+import logging
+import time
+
+# How frames are taken from the recording: "resample" interpolates the hands at every frame time, "decimate" shows
+# the last recorded frame at or before it.
+MODES = ["resample", "decimate"]
+
+
+def find_session(folder):
+    """
+    Returns the one session saved by the wizard in folder, see BatchReport.find_sessions.
+    """
+    sessions = Br.find_sessions(folder)
+
+    if len(sessions) != 1:
+        raise ValueError("Expected one session in {}, found {}".format(folder, len(sessions)))
+
+    return sessions[0]
+
+
+def get_trial_names(session):
+    """
+    Returns the names of the trials in the *_timestamps.csv of a session, in recorded order.
+    """
+    return list(pd.read_csv(session["_timestamps.csv"])['name'])
+
+
+def recording_bounds(index):
+    """
+    Returns the first and last timestamps of a leap data csv, leap microseconds, from the header of its store or by
+    reading only the last bucket of its index.
+    """
+    if isinstance(index, Lst.LeapStore):
+        return index.time_span
+
+    last_bucket_df = index.read_range(index.offset[-1], index.size, profile="report")
+
+    return int(index.timestamp[0]), int(last_bucket_df['timestamp'].max())
+
+
+def get_windows(session, index, start=None, end=None, trials=None):
+    """
+    Returns the stretches of the recording to replay, in leap microseconds.
+
+            Parameters:
+                    session (dict): From find_session.
+                    index (LeapIndex.LeapIndex): Index or LeapStore.LeapStore of the session leap data, see
+                                                 LeapStream.open_window_reader.
+                    start, end (float): Seconds from the start of the recording, or of each trial if trials are given.
+                    trials (list of str): Names in *_timestamps.csv, replayed in the order given.
+
+            Returns:
+                    starts, stops (arrays): First and last timestamp of each window.
+    """
+
+    first, last = recording_bounds(index)
+
+    if trials:
+        timestamps_data_df = pd.read_csv(session["_timestamps.csv"]).set_index("name")
+
+        missing = [name for name in trials if name not in timestamps_data_df.index]
+        if missing:
+            raise ValueError("No trials named {} in {}, expected one of {}".format(
+                ", ".join(missing), session["_timestamps.csv"], ", ".join(get_trial_names(session))))
+
+        clock = Lr.get_clock_sync(pd.read_csv(session["_leap_timestamps.csv"]))
+
+        rows = timestamps_data_df.loc[trials]
+        starts = clock.to_leap(rows['start'].to_numpy(dtype=float))
+        stops = clock.to_leap(rows['stop'].to_numpy(dtype=float))
+    else:
+        starts = np.array([first], dtype=float)
+        stops = np.array([last], dtype=float)
+
+    origins = starts.copy()
+
+    if start is not None:
+        starts = np.maximum(starts, origins + start * 10 ** 6)
+    if end is not None:
+        stops = np.minimum(stops, origins + end * 10 ** 6)
+
+    starts, stops = np.clip(starts, first, last), np.clip(stops, first, last)
+
+    return starts[stops > starts], stops[stops > starts]
+
+
+def get_frame_timestamps(starts, stops, fps, max_frames=None):
+    """
+    Returns the frame times of every window at fps, leap microseconds, and the framerate used. With max_frames the
+    framerate is lowered so that the video has at most that many frames.
+    """
+    duration = np.sum(stops - starts) * 10 ** -6
+
+    if max_frames and duration * fps > max_frames:
+        fps = max_frames / duration
+        logging.warning("Lowered the framerate to {:.2f} fps for at most {} frames".format(fps, max_frames))
+
+    step = 10 ** 6 / fps
+    timestamps = [np.arange(window_start, window_stop, step) for window_start, window_stop in zip(starts, stops)]
+
+    timestamps = np.concatenate(timestamps) if timestamps else np.array([])
+
+    return timestamps[:max_frames] if max_frames else timestamps, fps
+
+
+def load_windows(index, starts, stops, hand=None):
+    """
+    Reads the "video" profile columns of the windows from an index or store, with a margin around them so that the
+    first frames can be interpolated.
+    """
+    windows = [index.read_window(window_start, window_stop, profile="video", exact=False)
+               for window_start, window_stop in zip(starts, stops)]
+
+    leap_df = pd.concat(windows, ignore_index=True).drop_duplicates(["frame_id", "hand_id"])
+
+    if hand is not None:
+        leap_df = leap_df[leap_df['hand_type'] == hand]
+
+    return leap_df
+
+
+def get_video_data(leap_df, timestamps, mode="resample"):
+    """
+    Returns the hands of each frame as data indexed by timestamp, and the timestamps to look them up with.
+
+            Parameters:
+                    leap_df (pandas dataframe): Leap data, at least the "video" profile.
+                    timestamps (array): Frame times, leap microseconds.
+                    mode (str): One of MODES.
+
+            Returns:
+                    video_df (pandas dataframe): Hands indexed by timestamp.
+                    frame_timestamps (array): The index value of each frame. Frames without hands match no rows.
+    """
+
+    if mode == "resample":
+        return Lrs.resample_leap(leap_df, timestamps, "linear"), timestamps
+
+    if mode != "decimate":
+        raise ValueError("Unknown replay mode '{}', expected one of {}".format(mode, MODES))
+
+    # Last recorded frame at or before each frame time
+    recorded = np.unique(leap_df['timestamp'].to_numpy())
+    positions = np.searchsorted(recorded, timestamps, side='right') - 1
+
+    frame_timestamps = np.where(positions >= 0, recorded[np.maximum(positions, 0)], -1)
+
+    # Copied into consolidated blocks, as read_csv may leave one per column
+    video_df = leap_df[leap_df['timestamp'].isin(frame_timestamps)].set_index('timestamp').copy()
+
+    return video_df, frame_timestamps
+
+
+def replay(folder, output, fps=30., mode="resample", start=None, end=None, trials=None, hand=None, max_frames=None,
+           renderer="opencv", workers=1, width=500, height=400):
+    """
+    Replays the hands of a session to a video, reading only the parts of the recording that are shown.
+
+            Parameters:
+                    folder (str): Session directory.
+                    output (str): Video filename, must contain extension.
+                    fps (float): Framerate of the video, also the rate the recording is sampled at.
+                    mode (str): One of MODES.
+                    start, end (float): Seconds from the start of the recording, or of each trial.
+                    trials (list of str): Names in *_timestamps.csv to replay, one after another.
+                    hand (str): "left" or "right" to draw only that hand.
+                    max_frames (int): Cap on the frames of the video, see get_frame_timestamps.
+                    renderer (str): See LeapVideo.RENDERERS.
+                    workers (int): Processes rendering the video, see LeapVideo.make_leap_video.
+
+            Returns:
+                    frames (int): Frames written.
+    """
+
+    logging.info("Replaying {} to {}".format(folder, output))
+
+    session = find_session(folder)
+    index = Lsm.open_window_reader(session["_leap_data.csv"])
+
+    starts, stops = get_windows(session, index, start, end, trials)
+    timestamps, fps = get_frame_timestamps(starts, stops, fps, max_frames)
+
+    if len(timestamps) == 0:
+        raise ValueError("Nothing to replay in {}".format(folder))
+
+    print("{} frames, {:.1f} s at {:.2f} fps".format(len(timestamps), len(timestamps) / fps, fps))
+
+    video_df, frame_timestamps = get_video_data(load_windows(index, starts, stops, hand), timestamps, mode)
+
+    begin = time.perf_counter()
+
+    with tqdm(total=len(timestamps), unit="frames") as progress:
+        Lv.make_leap_video(output, fps, video_df, frame_timestamps, width, height, renderer=renderer, workers=workers,
+                           progress=progress.update)
+
+    seconds = time.perf_counter() - begin
+
+    print("Wrote {} frames in {:.2f} s, {:.1f} frames/s".format(len(timestamps), seconds, len(timestamps) / seconds))
+
+    return len(timestamps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays the hands of a recorded session to a video.")
+    parser.add_argument("folder", help="Session directory.")
+    parser.add_argument("output", help="Video file, e.g. replay.mp4.")
+    parser.add_argument("--fps", type=float, default=30, help="Framerate of the video.")
+    parser.add_argument("--mode", choices=MODES, default="resample",
+                        help="Interpolate the hands at each frame, or show the last recorded frame.")
+    parser.add_argument("--start", type=float, help="Seconds from the start of the recording, or of each trial.")
+    parser.add_argument("--end", type=float, help="Seconds from the start of the recording, or of each trial.")
+    parser.add_argument("--trial", action="append", help="Trial name in *_timestamps.csv, may be repeated.")
+    parser.add_argument("--hand", choices=["left", "right"], help="Draw only this hand.")
+    parser.add_argument("--max-frames", type=int, help="Lower the framerate to write at most this many frames.")
+    parser.add_argument("--renderer", choices=sorted(Lv.RENDERERS), default="opencv", help="Hand renderer.")
+    parser.add_argument("--workers", type=int, default=1, help="Processes rendering the video.")
+    parser.add_argument("--width", type=int, default=500, help="Frame width in pixels.")
+    parser.add_argument("--height", type=int, default=400, help="Frame height in pixels.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s:%(message)s')
+
+    if args.trial:
+        try:
+            names = get_trial_names(find_session(args.folder))
+        except ValueError as e:
+            parser.error(str(e))
+
+        missing = [name for name in args.trial if name not in names]
+        if missing:
+            parser.error("unknown --trial {}, choose from {}".format(
+                ", ".join(repr(name) for name in missing), ", ".join(repr(name) for name in names)))
+
+    replay(args.folder, args.output, args.fps, args.mode, args.start, args.end, args.trial, args.hand,
+           args.max_frames, args.renderer, args.workers, args.width, args.height)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,304 +1,421 @@
 import pandas as pd
 import numpy as np
-import datetime as dt
-import Leap_utils as Lp
+import LeapSchema as Ls
+import LeapLoader as Ll
+import LeapResample as Lrs
+import LeapStream as Lsm
+import LeapKinematics as Lk
+import LeapTrials as Lt
+import LeapClock as Lc
+import LeapSegmentation as Lsg
+import LeapVideo as Lv
 
-import matplotlib.pyplot as plt
 from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.figure import Figure
 
-from PIL import Image
-import cv2
-
-from scipy.signal import savgol_filter
-
+from concurrent.futures import ProcessPoolExecutor
 import logging
+import os
 
-def interpolate_leap_for_timestamps(leap_df, timestamps):
+def interpolate_leap_for_timestamps(leap_df, timestamps, method="cubic"):
     """
     Returns a dataframe of the specified timestamps, by interpolating the recorded data.
 
             Parameters:
                     leap_df (pandas dataframe): Recorded data.
                     timestamps (array of timestamps): Should be the same format as in leap_df
+                    method (str): "linear", "pchip" or "cubic".
 
             Returns:
-                    leap_df (pandas dataframe): Interpolated data.
+                    leap_df (pandas dataframe): Interpolated data, indexed by timestamp.
 
     """
 
     logging.info("Interpolating leap for timestamps")
-    # Make a copy of the data as we are going to be making changes
 
-    leap_interpolation_df = leap_df.copy(deep=True)
+    # Each hand_id is a continuous time that the hand has been active. One spline is fitted across all the columns
+    # of each, and evaluated only at the timestamps that fall inside it.
 
-    # 1. Split by hand_id. Each hand_id is a continuous time that the time has been active
-    # 2. Find which timestamps occur within each group.
+    return Lrs.resample_leap(leap_df, timestamps, method)
 
-    leap_hand_id_df = leap_interpolation_df.groupby(by="hand_id")
 
-    interpolated_dfs = []
+def make_leap_video(filename, framerate, data, timestamps, renderer="matplotlib", workers=1):
+    """
+    Creates a video from leap motion data, at specified timestamps.
 
-    for name, group in leap_hand_id_df:
+            Parameters:
+                    filename (str): filename, must contain extension.
+                    framerate (array of timestamps): frames per second the the video will play
+                    data (pandas dataframe: leap motion data, indexed by timestamp)
+                    timestamps (array): array of timestamps in unix epoch format.
+                    renderer (str): "matplotlib" or "opencv", see LeapVideo.RENDERERS.
+                    workers (int): Processes rendering segments of the video, one per CPU if None.
 
-        # Creat an blank dataframe, with the same format as the leap data. But for the number of
-        # timestamps that we want to interpolate for.
+            Returns:
+                    None
+    """
 
-        timestamps_empty = np.empty((len(timestamps), len(leap_df.columns)))
-        timestamps_empty[:] = np.nan
-        timestamps_df = pd.DataFrame(data=timestamps_empty, columns=leap_df.columns)
-        timestamps_df['timestamp'] = timestamps
+    logging.info("making leap video")
 
-        # Only keep those timestamps where hands are present in the data.
+    # One figure is kept for the whole video and only the hands are redrawn for each frame
+    Lv.make_leap_video(filename, framerate, data, timestamps, renderer=renderer, workers=workers)
 
-        min_timestamp = group['timestamp'].min()
-        max_timestamp = group['timestamp'].max()
 
-        timestamps_df = timestamps_df[(timestamps_df['timestamp'] >= min_timestamp)]
-        timestamps_df = timestamps_df[(timestamps_df['timestamp'] <= max_timestamp)]
+class TrialFigure():
+    """
+    The three panel figure of a trial, laid out once. Each save only updates the line data, axis limits, tone marker
+    and title, so a figure can be reused for every trial of a report.
+    """
 
-        # Concatenate the two dataframes together, and sort it into a format that is ready for
-        # interpolation.
+    panels = [('euclidean_distance', "Distance ($mm$)"),
+              ('velocity', "Speed ($mm$ $s^{-1}$)"),
+              ('acceleration', "Acceleration ($mm$ $s^{-2}$)")]
 
-        group = pd.concat([group, timestamps_df], axis=0).sort_values('timestamp')
+    def __init__(self):
+        # A figure of its own, not registered with pyplot, so that it is freed with this object and any backend or
+        # thread can render it.
+        self.fig = Figure(figsize=(15, 20))
+        FigureCanvasAgg(self.fig)
 
-        group = group.set_index('timestamp')  # needed for cubic interpolation
+        self.axes = self.fig.subplots(3, 1)
+        self.lines = []
+        self.tone_lines = []
+        self.tone_labels = []
 
-        numeric_group = group.select_dtypes(exclude='object')  # "hand_id" cannot be interpolated as it is a string
+        arrowprops = {'width': 1, 'headwidth': 1, 'headlength': 1, 'shrink': 0.05}
 
-        interpolated_group = numeric_group.interpolate(method='cubic', axis=0)  # interpolate across rows
+        for ax, (column, y_label) in zip(self.axes, self.panels):
+            self.lines.append(ax.plot([], [], color='black')[0])
 
-        group = group.fillna(method="ffill")  # forward fills "hand_id"
+            self.tone_lines.append(ax.axvline(0, alpha=0.5, color='black', label='Auditory tone', dashes=(5, 2, 1, 2)))
+            self.tone_labels.append(ax.annotate('Auditory tone', xy=(0, 0), xytext=(-10, 25), textcoords='offset points',
+                                                rotation=0, va='bottom', ha='right', annotation_clip=True,
+                                                arrowprops=arrowprops, backgroundcolor="w"))
 
-        group[interpolated_group.columns] = interpolated_group  # Brings in interpolated data
+            ax.grid(color='#F2F2F2', alpha=1, zorder=0)
+            ax.set_xlabel('Time ($s$)')
+            ax.set_ylabel(y_label)
 
-        #group = group.reindex(pd.Index(timestamps_df['timestamp']))  # Remove original data
+        self.title = self.fig.suptitle("", fontweight='bold', fontsize=24)
 
-        interpolated_dfs.append(group)  # This is repeated for each instance of a hand
+    def save(self, filename, name, leap_df, tone_timestamp):
+        """
+        Draws a trial and saves it.
 
-    return pd.concat(interpolated_dfs, axis=0).sort_values('timestamp')
+                Parameters:
+                        filename (str): Image file.
+                        name (str): Title.
+                        leap_df (pandas dataframe or dict of arrays): timestamp, euclidean_distance, velocity and
+                                                                     acceleration.
+                        tone_timestamp (float): Time of the auditory tone.
+        """
 
-def plot_leap_with_timestamp(fig, data, timestamp):
-    """
-    Returns a dataframe of the specified timestamps, by interpolating the recorded data.
+        logging.info("creating plot")
 
-            Parameters:
-                    leap_df (pandas dataframe): Recorded data.
-                    timestamps (array of timestamps): Should be the same format as in leap_df
+        timestamp = np.asarray(leap_df['timestamp'], dtype=float)
 
-            Returns:
-                    leap_df (pandas dataframe): Interpolated data.
+        for ax, line, tone_line, tone_label, (column, y_label) in zip(self.axes, self.lines, self.tone_lines,
+                                                                      self.tone_labels, self.panels):
+            line.set_data(timestamp, np.asarray(leap_df[column], dtype=float))
+            tone_line.set_xdata([tone_timestamp, tone_timestamp])
 
-    """
-    logging.info("Plot leap with timestamps")
+            ax.relim()
+            ax.autoscale_view()
 
+            ymin, ymax = ax.get_ylim()
+            tone_label.xy = (tone_timestamp, ymax * 0.4)
 
-    ax = fig.add_subplot(111, projection='3d')
+        self.title.set_text(name)
 
-    ax.set_xlim3d(-300, 150)
-    ax.set_ylim3d(-300, 150)
-    ax.set_zlim3d(-300, 150)
+        self.fig.savefig(filename)
 
-    ax.view_init(125, -140)
 
-    # Hide grid lines
-    ax.grid(False)
+def create_plot(filename, name, leap_df, tone_timestamp):
+    """
+    Saves the three panel figure of a single trial. For many trials use TrialFigure, or save_plots.
+    """
+    TrialFigure().save(filename, name, leap_df, tone_timestamp)
+
+
+def get_plot_job(filename, name, leap_df, tone_timestamp):
+    """
+    Returns the arguments of create_plot with only the plotted columns of the trial, as arrays, so that the job is
+    cheap to send to another process.
+    """
+    columns = ['timestamp', 'euclidean_distance', 'velocity', 'acceleration']
 
-    # Hide axes ticks
-    ax.set_xticks([])
-    ax.set_yticks([])
-    ax.set_zticks([])
+    return filename, name, {column: np.asarray(leap_df[column], dtype=float) for column in columns}, tone_timestamp
 
-    if timestamp in data.index.array:
 
-        tracking_event = data.loc[data.index == timestamp, :]
+_trial_figure = None  # the figure of this process, reused by every plot job it runs
 
-        tracking_event = Lp.get_tracking_event(tracking_event)  # get correct format for plotting
 
-        for hand in tracking_event.hands:
-            Lp.plot_hand(hand, ax)
+def _create_plot_job(job):
+    global _trial_figure
 
+    if _trial_figure is None:
+        _trial_figure = TrialFigure()
 
-def make_leap_video(filename, framerate, data, timestamps):
+    _trial_figure.save(*job)
+
+
+def save_plots(plot_jobs, workers=None):
     """
-    Creates a video from leap motion data, at specified timestamps.
+    Renders trial figures across a pool of processes.
 
             Parameters:
-                    filename (str): filename, must contain extension.
-                    framerate (array of timestamps): frames per second the the video will play
-                    data (pandas dataframe: leap motion data)
-                    timestamps (array): array of timestamps in unix epoch format.
+                    plot_jobs (list): create_plot arguments from get_plot_job.
+                    workers (int): Processes in the pool, one per CPU if None. With 1 the figures are rendered here,
+                                   one at a time.
 
             Returns:
                     None
     """
 
-    logging.info("making leap video")
+    logging.info("Saving {} plots".format(len(plot_jobs)))
+
+    if workers == 1 or len(plot_jobs) <= 1:
+        trial_figure = TrialFigure()
+        for job in plot_jobs:
+            trial_figure.save(*job)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(_create_plot_job, plot_jobs):
+            pass  # raises the first error of a worker here
+
+
+handedness = "right"
 
 
-    # For each timestamp there is either hand data or there isn't.
-    # But for each we need to create a frame anyway.
+# Seconds of leap data read either side of a streamed trial window for the smoothing filters
+SMOOTHING_MARGIN = 0.5
 
-    # Define the codec and create VideoWriter object
-    fourcc = cv2.VideoWriter_fourcc(*'MP4V')
-    out = cv2.VideoWriter(filename, fourcc, framerate, (500, 400))
 
-    for timestamp in timestamps:
-        # make a Figure and attach it to a canvas.
-        fig = Figure(figsize=(5, 4), dpi=100)
-        canvas = FigureCanvasAgg(fig)
+def get_clock_sync(leap_timestamps_df):
+    """
+    Returns the model of the leap clock against the system clock, fitted to every row of the leap timestamps.
+
+            Parameters:
+                    leap_timestamps_df (pandas dataframe): *_leap_timestamps.csv data.
 
-        plot_leap_with_timestamp(fig, data, timestamp)
+            Returns:
+                    clock (LeapClock.ClockSync): Converts leap timestamps to epoch seconds.
+    """
 
-        # Retrieve a view on the renderer buffer
-        canvas.draw()
-        buf = canvas.buffer_rgba()
-        # convert to a NumPy array
-        x = np.asarray(buf)
+    return Lc.ClockSync.from_dataframe(leap_timestamps_df)
 
-        img = Image.fromarray(x.astype(np.uint8))
-        opencvimage = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
 
-        out.write(opencvimage)
-        plt.close(fig)
+def get_report_trials(timestamps_data_df):
+    """
+    Returns the successful reach and grasp recordings, indexed by name.
+    """
 
-    out.release()
+    # Only successful recordings
+    timestamps_data_df = timestamps_data_df[timestamps_data_df["is_success"] == True]
 
+    # Index set to name as they should be unique successful recordings
+    timestamps_data_df = timestamps_data_df.set_index('name')
 
-def plot_leap(ax, leap_timestamps, leap_column, tone_timestamp, y_label):
+    # Remove Calibration and validation recordings
+    return timestamps_data_df.filter(like='Reach and Grasp', axis=0)
 
-    logging.info("plotting leap")
 
-    arrowprops = {'width': 1, 'headwidth': 1, 'headlength': 1, 'shrink': 0.05}
+def save_report(leap_timestamps_df, leap_data_df, timestamps_data_df, handedness, video_framerate=None,
+                report_dir="report", plot_workers=None, video_renderer="matplotlib",
+                video_workers=1):
+    """
+    Saves a plot of the palm kinematics of every successful reach and grasp trial to the report directory, and the
+    reach metrics of every trial to metrics.csv there. metrics.csv is written last.
 
-    ax.plot(leap_timestamps, leap_column, color='black')
+            Parameters:
+                    leap_timestamps_df (pandas dataframe): *_leap_timestamps.csv data.
+                    leap_data_df (pandas dataframe): *_leap_data.csv data, at least the "report" profile.
+                    timestamps_data_df (pandas dataframe): *_timestamps.csv data.
+                    handedness (str): Hand to report on.
+                    video_framerate (float): If given, a video of the hand is also made for each trial at this
+                                             framerate. Needs the "full" profile.
+                    report_dir (str): Existing directory the report is saved to.
+                    plot_workers (int): Processes rendering the plots, one per CPU if None, see save_plots.
+                    video_renderer (str): "matplotlib" or "opencv", see LeapVideo.RENDERERS.
+                    video_workers (int): Processes rendering each video, one per CPU if None, see
+                                         LeapVideo.make_leap_video.
 
-    ymin, ymax = ax.get_ylim()
+            Returns:
+                    None
+    """
 
+    logging.info("saving report")
 
-    ax.axvline(tone_timestamp, alpha=0.5, color='black', label='Auditory tone',
-               dashes=(5, 2, 1, 2))
-    ax.annotate('Auditory tone', xy=(tone_timestamp, ymax * 0.4), xytext=(-10, 25),
-                textcoords='offset points',
-                rotation=0, va='bottom', ha='right', annotation_clip=True, arrowprops=arrowprops, backgroundcolor="w")
 
+    handedness = handedness.lower()
 
-    ax.grid(color='#F2F2F2', alpha=1, zorder=0)
+    # Check the columns before any processing, so that a file from a different CallbackSample.exe build fails here
+    # with a list of the missing columns.
+    schema = Ls.LeapSchema.from_dataframe(leap_data_df, required=Ll.get_profile_columns("report"))
 
+    clock = get_clock_sync(leap_timestamps_df)
 
-    #ax.set_xticks(np.arange(0, leap_timestamps.max() + 1, step=1))
-    ax.set_xlabel('Time ($s$)')
+    # Load leap data. Convert timestamp column to epoch seconds
+    leap_data_df['timestamp'] = clock.to_epoch(leap_data_df['timestamp'].to_numpy())
 
-    ax.set_ylabel(y_label)
+    # Filter for only the dominant hand
+    leap_data_df = leap_data_df[leap_data_df['hand_type'] == handedness]
 
+    leap_data_df = leap_data_df.copy()
 
+    # Smoothed distance, velocity and acceleration from Savitzky-Golay filters over each continuous hand
+    distance, velocity, acceleration = Lk.palm_kinematics(leap_data_df['timestamp'].to_numpy(),
+                                                          leap_data_df.iloc[:, schema.palm["position"]].to_numpy(),
+                                                          leap_data_df['hand_id'].to_numpy())
 
+    leap_data_df['euclidean_distance'] = distance
+    leap_data_df['velocity'] = velocity
+    leap_data_df['acceleration'] = acceleration
+    leap_data_df['speed'] = Lk.palm_speed(leap_data_df['timestamp'].to_numpy(),
+                                          leap_data_df.iloc[:, schema.palm["position"]].to_numpy(),
+                                          leap_data_df['hand_id'].to_numpy())
 
+    timestamps_data_df = get_report_trials(timestamps_data_df)
 
-def create_plot(filename, name, leap_df, tone_timestamp):
+    trial_windows = Lt.TrialWindows(leap_data_df, timestamps_data_df)
 
-    logging.info("creating plot")
+    plot_jobs = []
 
-    fig, axes = plt.subplots(3, 1)
-    fig.set_size_inches(15, 20, forward=True)
+    for name, row, current_recording_df in trial_windows.windows():
+        tone_timestamp = row['timestamp']
 
-    ax_0 = axes[0]
-    plot_leap(ax_0, leap_df['timestamp'], leap_df['euclidean_distance'], tone_timestamp, "Distance ($mm$)")
+        plot_jobs.append(get_plot_job(os.path.join(report_dir, name + ".png"), name, current_recording_df,
+                                      tone_timestamp))
 
-    ax_1 = axes[1]
-    plot_leap(ax_1, leap_df['timestamp'], leap_df['velocity'], tone_timestamp, "Speed ($mm$ $s^{-1}$)")
+        if video_framerate and len(current_recording_df) > 1:
+            # Create an array of timestamps at a consistent framerate.
 
-    ax_2 = axes[2]
-    plot_leap(ax_2, leap_df['timestamp'], leap_df['acceleration'], tone_timestamp, "Acceleration ($mm$ $s^{-2}$)")
+            video_timestamps = np.arange(current_recording_df['timestamp'].min(),
+                                         current_recording_df['timestamp'].max(), 1 / video_framerate)
 
-    fig.suptitle(name, fontweight='bold', fontsize=24)
+            video_leap_df = interpolate_leap_for_timestamps(current_recording_df, video_timestamps)
 
-    plt.savefig(filename)
+            make_leap_video(os.path.join(report_dir, name + ".mp4"), video_framerate, video_leap_df, video_timestamps,
+                            renderer=video_renderer, workers=video_workers)
 
+    save_plots(plot_jobs, plot_workers)
 
-def datetime_string_to_epoch(datetime_string):
+    # Reaction and movement times of every trial, next to the plots
+    Lsg.trial_metrics(trial_windows).to_csv(os.path.join(report_dir, "metrics.csv"))
 
-    logging.info("datetime string to epoch")
 
-    system_timestamp_utc = dt.datetime.fromisoformat(datetime_string)
+def get_trial_kinematics(leap_timestamps_df, leap_data_path, trials, handedness, chunksize=10000, use_index=False,
+                         window_length=33, rate=None):
+    """
+    Reads the palm kinematics of each trial window from a leap data csv in bounded chunks, smoothed over each window
+    with a margin either side.
 
-    epoch = dt.datetime.utcfromtimestamp(0)
+            Parameters:
+                    leap_timestamps_df (pandas dataframe): *_leap_timestamps.csv data.
+                    leap_data_path (str): *_leap_data.csv file.
+                    trials (pandas dataframe): Trials indexed by name, see get_report_trials.
+                    handedness (str): Hand to report on, lower case.
+                    chunksize (int): Maximum rows of leap data held in memory at a time.
+                    use_index (bool): Read only the trial windows, using the sidecar index.
+                    window_length (int): Savitzky-Golay window, samples.
+                    rate (float): Rate in Hz the data is resampled to for smoothing, the recorded rate if None.
 
-    return (system_timestamp_utc - epoch).total_seconds()
+            Returns:
+                    trial_dfs (dict): Trial name to a dataframe with timestamp, hand_id, euclidean_distance, velocity,
+                                      acceleration, palm_position and speed columns.
+    """
 
-handedness = "right"
+    # Each window is read with a margin either side, so that the smoothing filters have no edge effects inside it
+    padded_trials = trials.assign(start=trials['start'] - SMOOTHING_MARGIN, stop=trials['stop'] + SMOOTHING_MARGIN)
 
+    trial_dfs = Lsm.stream_trial_kinematics(leap_data_path, padded_trials, get_clock_sync(leap_timestamps_df),
+                                            handedness, chunksize, use_index)
 
-def save_report(leap_timestamps_df, leap_data_df, timestamps_data_df, handedness):
+    for name, row in trials.iterrows():
+        current_recording_df = trial_dfs[name]
 
-    logging.info("saving report")
+        if len(current_recording_df):
+            # Differentiated the same way as save_report, over the padded window
+            timestamp = current_recording_df['timestamp'].to_numpy()
+            hand_id = current_recording_df['hand_id'].to_numpy()
 
+            smoothed = Lk.smoothed_derivatives(timestamp, current_recording_df['euclidean_distance'].to_numpy(),
+                                               hand_id, rate, window_length)
 
-    handedness = handedness.lower()
+            current_recording_df['euclidean_distance'], current_recording_df['velocity'], \
+                current_recording_df['acceleration'] = smoothed
 
-    # Load leap timestamps df. Convert both columns to epoch seconds
-    leap_timestamps_df['leap_timestamp'] = leap_timestamps_df['leap_timestamp'] * 10 ** - 6  # convert to seconds
-    leap_timestamps_df['system_timestamp'] = leap_timestamps_df['system_timestamp'].apply(datetime_string_to_epoch)
+            current_recording_df['speed'] = Lk.palm_speed(
+                timestamp, current_recording_df[Ls.vector_columns("palm_position")].to_numpy(), hand_id, rate,
+                window_length)
 
-    system_timestamp = leap_timestamps_df.iloc[0]['system_timestamp']
-    leap_timestamp = leap_timestamps_df.iloc[0]['leap_timestamp']
+            current_recording_df = current_recording_df.iloc[np.searchsorted(timestamp, row['start'], side='left'):
+                                                             np.searchsorted(timestamp, row['stop'], side='right')]
+        else:
+            current_recording_df = current_recording_df.assign(velocity=[], acceleration=[], speed=[])
 
-    # Load leap data. Convert timestamp column to epoch seconds
-    leap_data_df['timestamp'] = leap_data_df['timestamp'] * 10 ** - 6
-    leap_data_df['timestamp'] = leap_data_df['timestamp'] - leap_timestamp + system_timestamp
+        trial_dfs[name] = current_recording_df
 
-    # Filter for only the dominant hand
-    leap_data_df = leap_data_df[leap_data_df['hand_type'] == handedness]
+    return trial_dfs
 
-    leap_data_df['euclidean_distance'] = leap_data_df[['palm_position_x', 'palm_position_y', 'palm_position_z']].apply(
-        np.linalg.norm, axis=1)
 
-    d_time = leap_data_df['timestamp'].diff().fillna(0.)
+def save_report_from_csv(leap_timestamps_df, leap_data_path, timestamps_data_df, handedness, chunksize=10000,
+                         use_index=False, report_dir="report", window_length=33, rate=None, cache=None,
+                         plot_workers=None):
+    """
+    Creates the same report as save_report, reading the leap data csv in chunks so that the whole recording is never
+    held in memory.
 
-    leap_data_df['velocity'] = leap_data_df['euclidean_distance'].diff().fillna(0.) / d_time
-    leap_data_df['acceleration'] = leap_data_df['velocity'].diff().fillna(0.) / d_time
+            Parameters:
+                    leap_timestamps_df (pandas dataframe): *_leap_timestamps.csv data.
+                    leap_data_path (str): *_leap_data.csv file.
+                    timestamps_data_df (pandas dataframe): *_timestamps.csv data.
+                    handedness (str): Hand to report on.
+                    chunksize (int): Maximum rows of leap data held in memory at a time.
+                    use_index (bool): Read only the trial windows, using the sidecar index.
+                    report_dir (str): Existing directory the report is saved to.
+                    window_length (int): Savitzky-Golay window, samples.
+                    rate (float): Rate in Hz the data is resampled to for smoothing, the recorded rate if None.
+                    cache (LeapCache.LeapCache): If given, the trial kinematics are kept in and reused from it.
+                    plot_workers (int): Processes rendering the plots, one per CPU if None, see save_plots. Pass 1
+                                        to render here, e.g. from a process that is already one of a pool.
 
-    leap_data_df['euclidean_distance'] = savgol_filter(leap_data_df['euclidean_distance'] , 33, 3)
+            Returns:
+                    None
+    """
 
-    # Only successful recordings
-    timestamps_data_df = timestamps_data_df[timestamps_data_df["is_success"] == True]
+    logging.info("saving report from csv")
 
-    # Index set to name as they should be unique successful recordings
-    timestamps_data_df = timestamps_data_df.set_index('name')
+    trials = get_report_trials(timestamps_data_df)
+    handedness = handedness.lower()
 
-    # Remove Calibration and validation recordings
-    timestamps_data_df = timestamps_data_df.filter(like='Reach and Grasp', axis=0)
+    trial_dfs = None
 
-    for name, row in timestamps_data_df.iterrows():
-        start_timestamp = row['start']
-        stop_timestamp = row['stop']
-        tone_timestamp = row['timestamp']
+    if cache is not None:
+        key = cache.key(files=[leap_data_path], frames=[leap_timestamps_df, trials], stage="trial_kinematics",
+                        handedness=handedness, window_length=window_length, rate=rate, margin=SMOOTHING_MARGIN)
+        trial_dfs = cache.get_frames(key)
 
-        current_recording_df = leap_data_df[(leap_data_df['timestamp'] >= start_timestamp)].copy(deep=True)
+    if trial_dfs is None:
+        trial_dfs = get_trial_kinematics(leap_timestamps_df, leap_data_path, trials, handedness, chunksize, use_index,
+                                         window_length, rate)
 
-        current_recording_df = current_recording_df[(current_recording_df['timestamp'] <= stop_timestamp)]
+        if cache is not None:
+            cache.put_frames(key, trial_dfs)
 
-        create_plot("report/" + name + ".png", name, current_recording_df, tone_timestamp)
-        # Create an array of timestamps at a consistent framerate.
+    save_plots([get_plot_job(os.path.join(report_dir, name + ".png"), name, trial_dfs[name], row['timestamp'])
+                for name, row in trials.iterrows()], plot_workers)
 
-        # framerate = 24
-        #
-        # video_timestamps = []
-        #
-        # timestamp = current_recording_df['timestamp'].min()
-        # while timestamp <= current_recording_df['timestamp'].max():
-        #     video_timestamps.append(timestamp)
-        #     timestamp += 1 / framerate
-        #
-        # video_leap_df = interpolate_leap_for_timestamps(leap_data_df, video_timestamps)
-        #
-        # make_leap_video("report/" + name + ".mp4", 24, video_leap_df, video_timestamps)
+    # Reaction and movement times of every trial, next to the plots
+    recording_df = pd.concat([trial_dfs[name] for name in trials.index], axis=0, ignore_index=True)
+    Lsg.trial_metrics(Lt.TrialWindows(recording_df, trials)).to_csv(os.path.join(report_dir, "metrics.csv"))
 
 
 if __name__ == "__main__":
 
     handedness = "right"
     timestamps = pd.read_csv("20210917-170338_te_timestamps.csv")
-    leap_df = pd.read_csv("20210917-170338_te_leap_data.csv")
+    leap_df = Ll.load_leap_csv("20210917-170338_te_leap_data.csv", "report")
     leap_timestamps_df = pd.read_csv("20210917-170338_te_leap_timestamps.csv")
     save_report(leap_timestamps_df,leap_df,timestamps,handedness)
\ No newline at end of file
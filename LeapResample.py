@@ -0,0 +1,146 @@
+import pandas as pd
+import numpy as np
+
+from scipy.interpolate import CubicSpline, PchipInterpolator
+
+import LeapSchema as Ls
+import LeapQuaternion as Lq
+
+import logging
+
+METHODS = ["linear", "pchip", "cubic"]
+
+
+def _fit(method, timestamp, values, new_timestamp):
+    """
+    Evaluates one interpolant fitted across every column of values at once.
+    """
+    if len(timestamp) == 1:
+        return np.repeat(values, len(new_timestamp), axis=0)
+
+    if method == "linear":
+        i = np.clip(np.searchsorted(timestamp, new_timestamp, side='right') - 1, 0, len(timestamp) - 2)
+        fraction = ((new_timestamp - timestamp[i]) / (timestamp[i + 1] - timestamp[i]))[:, np.newaxis]
+        return values[i] + fraction * (values[i + 1] - values[i])
+
+    if method == "pchip":
+        return PchipInterpolator(timestamp, values, axis=0)(new_timestamp)
+
+    return CubicSpline(timestamp, values, axis=0)(new_timestamp)
+
+
+def _interpolate(method, timestamp, values, new_timestamp):
+    """
+    Evaluates values at new_timestamp. Columns without missing values share one interpolant. Columns with missing
+    values, e.g. derivatives of a hand tracked for less than a filter window, are fitted on their finite rows only,
+    one interpolant per pattern of missing rows, and are NaN outside the span of those rows.
+    """
+    finite = np.isfinite(values)
+
+    if finite.all():
+        return _fit(method, timestamp, values, new_timestamp)
+
+    result = np.full((len(new_timestamp), values.shape[1]), np.nan)
+
+    patterns, groups = np.unique(finite, axis=1, return_inverse=True)
+    groups = groups.ravel()
+
+    for group, rows in enumerate(patterns.T):
+        if not rows.any():
+            continue
+
+        columns = np.flatnonzero(groups == group)
+        inside = np.flatnonzero((new_timestamp >= timestamp[rows][0]) & (new_timestamp <= timestamp[rows][-1]))
+
+        result[np.ix_(inside, columns)] = _fit(method, timestamp[rows], values[np.ix_(rows, columns)],
+                                               new_timestamp[inside])
+
+    return result
+
+
+def resample_leap(leap_df, timestamps, method="cubic"):
+    """
+    Resamples leap data at new timestamps, separately for each hand_id. Each hand_id is a continuous time that a
+    hand was tracked, and only the timestamps inside it are evaluated.
+
+    Every measurement of a hand is resampled by a single interpolant over the whole numeric matrix, quaternion groups
+    by slerp, and ids, flags and hand_type hold the value of the previous sample. Missing measurements stay missing,
+    see _interpolate.
+
+            Parameters:
+                    leap_df (pandas dataframe): Recorded data, any load profile.
+                    timestamps (array): Times to resample at, same units as leap_df['timestamp'].
+                    method (str): "linear", "pchip" or "cubic".
+
+            Returns:
+                    resampled_df (pandas dataframe): Resampled data indexed by timestamp, one row per hand tracked at
+                                                     each timestamp.
+    """
+
+    logging.info("Resampling leap data, {}".format(method))
+
+    if method not in METHODS:
+        raise ValueError("Unknown resampling method '{}', expected one of {}".format(method, METHODS))
+
+    timestamps = np.sort(np.asarray(timestamps, dtype=np.float64))
+    columns = [column for column in leap_df.columns if column != 'timestamp']
+
+    rotation_columns = [column for group in Ls.rotation_groups() for column in Ls.quaternion_columns(group)
+                        if all(name in leap_df.columns for name in Ls.quaternion_columns(group))]
+    float_columns = [column for column in columns if pd.api.types.is_float_dtype(leap_df[column].dtype)
+                     and column not in set(rotation_columns)]
+    held_columns = [column for column in columns if column not in set(float_columns + rotation_columns)]
+
+    segments = []
+
+    # Sorting by hand then time once makes every hand_id a contiguous block
+    leap_df = leap_df.sort_values(['hand_id', 'timestamp'], kind='stable')
+    hand_id = leap_df['hand_id'].to_numpy()
+    boundaries = np.flatnonzero(hand_id[1:] != hand_id[:-1]) + 1
+
+    timestamp = leap_df['timestamp'].to_numpy(dtype=np.float64)
+    float_values = leap_df[float_columns].to_numpy(dtype=np.float64)
+    rotation_values = leap_df[rotation_columns].to_numpy(dtype=np.float64).reshape(len(leap_df), -1, 4)
+
+    for start, stop in zip(np.concatenate(([0], boundaries)), np.concatenate((boundaries, [len(leap_df)]))):
+        if stop <= start:
+            continue
+
+        segment_time = timestamp[start:stop]
+
+        # Repeated timestamps cannot be interpolated through, keep the last sample of each
+        keep = np.concatenate((segment_time[1:] != segment_time[:-1], [True]))
+        rows = np.arange(start, stop)[keep]
+        segment_time = segment_time[keep]
+
+        first = np.searchsorted(timestamps, segment_time[0], side='left')
+        last = np.searchsorted(timestamps, segment_time[-1], side='right')
+        new_timestamp = timestamps[first:last]
+
+        if len(new_timestamp) == 0:
+            continue
+
+        previous = rows[np.clip(np.searchsorted(segment_time, new_timestamp, side='right') - 1, 0, len(rows) - 1)]
+
+        parts = [leap_df.iloc[previous][held_columns].reset_index(drop=True),
+                 pd.DataFrame({'timestamp': new_timestamp}),
+                 pd.DataFrame(_interpolate(method, segment_time, float_values[rows], new_timestamp),
+                              columns=float_columns)]
+
+        if rotation_columns:
+            parts.append(pd.DataFrame(Lq.slerp_resample(segment_time, rotation_values[rows], new_timestamp)
+                                      .reshape(len(new_timestamp), -1), columns=rotation_columns))
+
+        # Building the segment in one concat avoids inserting hundreds of columns one at a time
+        segment_df = pd.concat(parts, axis=1)
+
+        segments.append(segment_df)
+
+    if segments:
+        resampled_df = pd.concat(segments, axis=0, ignore_index=True)
+    else:
+        resampled_df = pd.DataFrame(columns=['timestamp'] + columns)
+
+    resampled_df = resampled_df.sort_values('timestamp', kind='stable').set_index('timestamp')
+
+    return resampled_df[columns]
@@ -0,0 +1,253 @@
+import numpy as np
+import logging
+import difflib
+import csv
+
+DIGIT_NAMES = ["thumb", "index", "middle", "ring", "pinky"]
+BONE_NAMES = ["metacarpal", "proximal", "intermediate", "distal"]
+JOINT_NAMES = ["prev_joint", "next_joint"]
+AXES = ["x", "y", "z"]
+QUATERNION_AXES = ["w", "x", "y", "z"]
+
+FRAME_COLUMNS = ["frame_id", "timestamp", "tracking_frame_id", "nHands", "framerate"]
+HAND_COLUMNS = ["hand_id", "hand_type", "visible_time", "pinch_distance", "grab_angle", "pinch_strength",
+                "grab_strength"]
+PALM_VECTORS = ["position", "stabilized_position", "velocity", "normal", "direction"]
+
+
+def _hand_segments():
+    """
+    Returns the pairs of hand points joined by a line when a hand is drawn: every bone of every digit, the arm, then
+    the outline of the palm through the metacarpal heads (next_joint) of the index, middle, ring and pinky.
+
+    The hand points are the prev_joint and next_joint of every bone, DIGIT_NAMES then BONE_NAMES order, followed by
+    the two arm joints: the (5, 4, 2, 3) joints array of LeapFrames.HandFrameArray reshaped to (40, 3), with the
+    (2, 3) arm joints after it.
+    """
+    bones = np.arange((len(DIGIT_NAMES) * len(BONE_NAMES) + 1) * len(JOINT_NAMES)).reshape(-1, len(JOINT_NAMES))
+
+    metacarpal = BONE_NAMES.index("metacarpal")
+    knuckles = [bones[DIGIT_NAMES.index(digit) * len(BONE_NAMES) + metacarpal, JOINT_NAMES.index("next_joint")]
+                for digit in ["index", "middle", "ring", "pinky"]]
+
+    return np.concatenate((bones, np.stack((knuckles[:-1], knuckles[1:]), axis=1)))
+
+
+# (24, 2) indices of the hand points at either end of each drawn line, see _hand_segments
+HAND_SEGMENTS = _hand_segments()
+
+
+class LeapSchemaError(ValueError):
+    """
+    Raised when a leap data file does not have the columns written by CallbackSample.exe.
+    """
+    pass
+
+
+def column_name(*parts):
+    """
+    Returns the column name of a (hand part, bone, joint, axis) combination, e.g. ("index", "distal", "next_joint",
+    "x") gives "index_distal_next_joint_x".
+    """
+    return "_".join(parts)
+
+
+def vector_columns(name):
+    return [column_name(name, axis) for axis in AXES]
+
+
+def quaternion_columns(name):
+    return [column_name(name, axis) for axis in QUATERNION_AXES]
+
+
+def bone_columns(name):
+    """
+    Returns the column names of a bone, in the order prev_joint xyz, next_joint xyz, width, rotation wxyz.
+    """
+    columns = []
+    for joint in JOINT_NAMES:
+        columns += vector_columns(column_name(name, joint))
+    columns.append(column_name(name, "width"))
+    columns += quaternion_columns(column_name(name, "rotation"))
+
+    return columns
+
+
+def leap_data_columns():
+    """
+    Returns the full list of columns written by CallbackSample.exe to *_leap_data.csv.
+    """
+    columns = FRAME_COLUMNS + HAND_COLUMNS
+
+    for vector in PALM_VECTORS:
+        columns += vector_columns("palm_" + vector)
+    columns.append("palm_width")
+    columns += quaternion_columns("palm_orientation")
+
+    columns += bone_columns("arm")
+
+    for digit in DIGIT_NAMES:
+        columns += [digit + "_finger_id", digit + "_is_extended"]
+        for bone in BONE_NAMES:
+            columns += bone_columns(column_name(digit, bone))
+
+    return columns
+
+
+def rotation_groups():
+    """
+    Returns the names of every quaternion column group, e.g. "palm_orientation" for palm_orientation_w/x/y/z.
+    """
+    groups = ["palm_orientation", "arm_rotation"]
+
+    for digit in DIGIT_NAMES:
+        for bone in BONE_NAMES:
+            groups.append(column_name(digit, bone, "rotation"))
+
+    return groups
+
+
+def skeleton_columns():
+    """
+    Returns the columns needed to draw a hand: the frame columns, hand_id and hand_type, the palm position and the
+    joints of the arm and every bone.
+    """
+    columns = FRAME_COLUMNS + ["hand_id", "hand_type"] + vector_columns("palm_position")
+
+    for joint in JOINT_NAMES:
+        columns += vector_columns(column_name("arm", joint))
+
+    for digit in DIGIT_NAMES:
+        for bone in BONE_NAMES:
+            for joint in JOINT_NAMES:
+                columns += vector_columns(column_name(digit, bone, joint))
+
+    return columns
+
+
+def column_dtype(name):
+    """
+    Returns the compact dtype a leap data column is loaded as. Ids and the microsecond timestamp stay 64 bit
+    integers, hand_type is categorical and measurements are float32, which is finer than the sensor's precision.
+    """
+    if name in ("frame_id", "timestamp", "tracking_frame_id", "hand_id"):
+        return "int64"
+    if name == "nHands" or name.endswith("_finger_id") or name.endswith("_is_extended"):
+        return "int8"
+    if name == "hand_type":
+        return "category"
+    if name == "visible_time":
+        return "float64"  # microseconds, too large for float32
+
+    return "float32"
+
+
+def leap_data_dtypes(columns):
+    return {name: column_dtype(name) for name in columns}
+
+
+class LeapSchema():
+    """
+    Column layout of a leap data file, compiled once from its header.
+
+    Every column the parsing and plotting code needs is resolved to an integer position when the schema is built,
+    and grouped into index arrays with the same shape as the arrays they fill. For example joints has shape
+    (5 digits, 4 bones, 2 joints, 3 axes), so data[:, schema.joints] gives every joint of every frame.
+
+    Data loaded with a column profile only has some of the columns. Those are the required columns, and index arrays
+    of groups that were not loaded are None.
+    """
+
+    def __init__(self, columns, required=None):
+
+        self.columns = list(columns)
+        self.positions = {name: position for position, name in enumerate(self.columns)}
+        self.required = leap_data_columns() if required is None else list(required)
+
+        self.validate()
+
+        self.frame = {name: self.positions[name] for name in FRAME_COLUMNS if name in self.positions}
+        self.hand = {name: self.positions[name] for name in HAND_COLUMNS if name in self.positions}
+
+        self.palm = {vector: self.get_indices(vector_columns("palm_" + vector)) for vector in PALM_VECTORS}
+        self.palm_width = self.positions.get("palm_width")
+        self.palm_orientation = self.get_indices(quaternion_columns("palm_orientation"))
+
+        self.arm_joints = self.get_indices([vector_columns(column_name("arm", joint)) for joint in JOINT_NAMES])
+        self.arm_width = self.positions.get("arm_width")
+        self.arm_rotation = self.get_indices(quaternion_columns("arm_rotation"))
+
+        self.finger_id = self.get_indices([column_name(digit, "finger_id") for digit in DIGIT_NAMES])
+        self.is_extended = self.get_indices([column_name(digit, "is_extended") for digit in DIGIT_NAMES])
+
+        self.joints = self.get_indices([[[vector_columns(column_name(digit, bone, joint)) for joint in JOINT_NAMES]
+                                         for bone in BONE_NAMES] for digit in DIGIT_NAMES])
+        self.bone_width = self.get_indices([[column_name(digit, bone, "width") for bone in BONE_NAMES]
+                                            for digit in DIGIT_NAMES])
+        self.bone_rotation = self.get_indices([[quaternion_columns(column_name(digit, bone, "rotation"))
+                                                for bone in BONE_NAMES] for digit in DIGIT_NAMES])
+
+    @classmethod
+    def from_csv(cls, path, required=None):
+        """
+        Builds the schema from the header line of a leap data csv, without reading any data.
+        """
+        logging.info("Reading leap data header {}".format(path))
+
+        with open(path, newline='') as f:
+            header = next(csv.reader(f), [])
+
+        return cls(header, required)
+
+    @classmethod
+    def from_dataframe(cls, leap_df, required=None):
+        return cls(leap_df.columns, required)
+
+    def validate(self):
+        """
+        Raises a LeapSchemaError naming every missing column, with the closest column found for each one.
+        """
+
+        duplicates = sorted(set(name for name in self.columns if self.columns.count(name) > 1))
+        if duplicates:
+            raise LeapSchemaError("Leap data has duplicate columns: " + ", ".join(duplicates))
+
+        known = set(leap_data_columns())
+        expected = self.required
+        missing = [name for name in expected if name not in self.positions]
+
+        if missing:
+            unexpected = [name for name in self.columns if name not in known]
+
+            lines = []
+            for name in missing:
+                close = difflib.get_close_matches(name, unexpected, n=1)
+                if close:
+                    lines.append("\t" + name + " (found " + close[0] + ")")
+                else:
+                    lines.append("\t" + name)
+
+            raise LeapSchemaError("Leap data is missing {} of {} columns, it may have been written by a different "
+                                  "version of CallbackSample.exe:\n".format(len(missing), len(expected))
+                                  + "\n".join(lines))
+
+        extra = len(set(self.columns) - known)
+        if extra:
+            logging.warning("Leap data has {} columns that are not used".format(extra))
+
+    def get_index(self, *parts):
+        """
+        Returns the column position of a (hand part, bone, joint, axis) combination.
+        """
+        return self.positions[column_name(*parts)]
+
+    def get_indices(self, names):
+        """
+        Returns an integer array of column positions, with the same shape as the nested list of names. None if any of
+        the columns were not loaded.
+        """
+        names = np.asarray(names)
+        if not all(name in self.positions for name in names.ravel()):
+            return None
+
+        return np.array([self.positions[name] for name in names.ravel()], dtype=np.intp).reshape(names.shape)
@@ -0,0 +1,120 @@
+import pandas as pd
+import numpy as np
+
+import logging
+
+# Metrics written for every trial, times in seconds. samples is the number of samples from the tone to the end of the
+# trial window.
+METRIC_COLUMNS = ["tone_timestamp", "onset_timestamp", "peak_timestamp", "offset_timestamp", "reaction_time",
+                  "movement_time", "time_to_peak", "peak_speed", "samples"]
+
+
+def segment_reaches(timestamp, speed, starts, stops, tone_timestamp, fraction=0.05, min_speed=20.):
+    """
+    Finds the reach of every trial at once: the run of samples around the peak speed after the tone where the speed
+    stays above a threshold.
+
+    The threshold of a trial is fraction of its peak speed, but at least min_speed. Onset is the first sample of the
+    run and offset the first sample after it, or the end of the window if the hand is still moving.
+
+            Parameters:
+                    timestamp (array): (n,) sample times in epoch seconds, in time order.
+                    speed (array): (n,) palm speed in mm/s. NaN is taken as still.
+                    starts, stops (arrays): (trials,) first row and one past the last row of each trial window.
+                    tone_timestamp (array): (trials,) tone times in epoch seconds.
+                    fraction (float): Threshold as a fraction of the peak speed.
+                    min_speed (float): Lowest threshold in mm/s, so that a still hand has no reach.
+
+            Returns:
+                    metrics (dict): METRIC_COLUMNS to (trials,) arrays, NaN for trials with no samples after the tone.
+    """
+
+    timestamp = np.asarray(timestamp, dtype=np.float64)
+    speed = np.nan_to_num(np.asarray(speed, dtype=np.float64), nan=0.)
+    tone_timestamp = np.asarray(tone_timestamp, dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.asarray(stops, dtype=np.int64)
+
+    n_trials = len(starts)
+
+    # Only the samples after the tone are searched. Each window is a contiguous range of rows.
+    firsts = np.clip(np.searchsorted(timestamp, tone_timestamp, side='left'), starts, np.maximum(starts, stops))
+    lengths = np.maximum(stops - firsts, 0)
+
+    metrics = {column: np.full(n_trials, np.nan) for column in METRIC_COLUMNS}
+    metrics["tone_timestamp"] = tone_timestamp.copy()
+    metrics["samples"] = lengths.astype(np.float64)
+
+    valid = lengths > 0
+    if not np.any(valid):
+        return metrics
+
+    # Every searched sample, with the trial it belongs to, as one flat array
+    trial = np.repeat(np.arange(n_trials), lengths)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    rows = np.arange(lengths.sum()) - np.repeat(offsets, lengths) + np.repeat(firsts, lengths)
+    position = np.arange(len(rows))
+
+    trial_speed = speed[rows]
+
+    peak_speed = np.zeros(n_trials)
+    peak_speed[valid] = np.maximum.reduceat(trial_speed, offsets[valid])
+
+    # First sample of each trial at its peak speed
+    at_peak = np.where(trial_speed == peak_speed[trial], position, len(rows))
+    peak = np.full(n_trials, len(rows))
+    peak[valid] = np.minimum.reduceat(at_peak, offsets[valid])
+
+    threshold = np.maximum(fraction * peak_speed, min_speed)
+    below = trial_speed < threshold[trial]
+
+    # Last still sample before the peak, and first still sample after it
+    before = np.where(below & (position < peak[trial]), position, -1)
+    after = np.where(below & (position > peak[trial]), position, len(rows))
+
+    onset = np.full(n_trials, -1)
+    onset[valid] = np.maximum.reduceat(before, offsets[valid])
+    onset = np.where(onset < 0, offsets, onset + 1)
+
+    offset = np.full(n_trials, len(rows))
+    offset[valid] = np.minimum.reduceat(after, offsets[valid])
+    offset = np.where(offset >= offsets + lengths, offsets + lengths - 1, offset)
+
+    moved = valid & (peak_speed >= min_speed)
+
+    onset_timestamp = timestamp[rows[np.clip(onset, 0, len(rows) - 1)]]
+    peak_timestamp = timestamp[rows[np.clip(peak, 0, len(rows) - 1)]]
+    offset_timestamp = timestamp[rows[np.clip(offset, 0, len(rows) - 1)]]
+
+    metrics["onset_timestamp"] = np.where(moved, onset_timestamp, np.nan)
+    metrics["peak_timestamp"] = np.where(moved, peak_timestamp, np.nan)
+    metrics["offset_timestamp"] = np.where(moved, offset_timestamp, np.nan)
+    metrics["reaction_time"] = metrics["onset_timestamp"] - tone_timestamp
+    metrics["movement_time"] = metrics["offset_timestamp"] - metrics["onset_timestamp"]
+    metrics["time_to_peak"] = metrics["peak_timestamp"] - metrics["onset_timestamp"]
+    metrics["peak_speed"] = np.where(valid, peak_speed, np.nan)
+
+    return metrics
+
+
+def trial_metrics(trial_windows, speed_column='speed', fraction=0.05, min_speed=20.):
+    """
+    Returns the reach metrics of every trial window.
+
+            Parameters:
+                    trial_windows (LeapTrials.TrialWindows): Windows over data with 'timestamp' in epoch seconds and a
+                                                             palm speed column. The trials need a 'timestamp' column
+                                                             holding the tone times.
+                    speed_column (str): Palm speed column, mm/s.
+
+            Returns:
+                    metrics_df (pandas dataframe): METRIC_COLUMNS, indexed by trial name.
+    """
+
+    logging.info("Segmenting {} trials".format(len(trial_windows)))
+
+    metrics = segment_reaches(trial_windows.timestamp, trial_windows.data_df[speed_column].to_numpy(),
+                              trial_windows.starts, trial_windows.stops,
+                              trial_windows.trials['timestamp'].to_numpy(), fraction, min_speed)
+
+    return pd.DataFrame(metrics, index=trial_windows.trials.index, columns=METRIC_COLUMNS)
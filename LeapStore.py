@@ -0,0 +1,303 @@
+import pandas as pd
+import numpy as np
+
+import LeapSchema as Ls
+import LeapLoader as Ll
+
+import logging
+import json
+import os
+import shutil
+
+STORE_VERSION = 1
+HEADER_FILE = "header.json"
+
+# Leap microseconds added either side of a window read with exact=False, about one LeapIndex bucket
+WINDOW_MARGIN = 100000
+
+
+def store_path(csv_path):
+    """
+    Returns the directory of the binary store kept next to a *_leap_data.csv file.
+    """
+    return os.path.splitext(csv_path)[0] + "_columns"
+
+
+def is_current(csv_path, path=None):
+    """
+    Returns True if the binary store exists and was converted from the current version of the csv.
+    """
+    path = path or store_path(csv_path)
+    header_file = os.path.join(path, HEADER_FILE)
+
+    if not os.path.exists(header_file):
+        return False
+
+    with open(header_file) as f:
+        header = json.load(f)
+
+    return header.get("version") == STORE_VERSION and \
+        header.get("source_size") == os.path.getsize(csv_path) and \
+        header.get("source_mtime") == os.path.getmtime(csv_path)
+
+
+def _count_rows(csv_path):
+    """
+    Returns the number of data rows in a csv by counting line breaks, without parsing it.
+    """
+    lines = 0
+    last = b"\n"
+    with open(csv_path, "rb") as f:
+        for block in iter(lambda: f.read(2 ** 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+
+    if last != b"\n":
+        lines += 1  # last line has no line break
+
+    return max(lines - 1, 0)  # header
+
+
+def _write_column(arrays, name, file, values, position, rows):
+    """
+    Writes values at position of the memory-mapped column arrays[name], stored in file, creating it on the first
+    chunk. If a later chunk needs a wider dtype, for example a missing value in an integer column, the column is
+    copied to the wider dtype. Both memmaps are released before the copy replaces file, as a mapped file cannot be
+    replaced or moved on Windows.
+    """
+
+    array = arrays[name]
+    arrays[name] = None
+
+    if array is None:
+        array = np.lib.format.open_memmap(file, mode='w+', dtype=values.dtype, shape=(rows,))
+
+    elif np.result_type(array.dtype, values.dtype) != array.dtype:
+        promoted = np.lib.format.open_memmap(file + ".tmp", mode='w+',
+                                             dtype=np.result_type(array.dtype, values.dtype), shape=(rows,))
+        promoted[:position] = array[:position]
+        promoted.flush()
+        del array, promoted
+        os.replace(file + ".tmp", file)
+        array = np.lib.format.open_memmap(file, mode='r+')
+
+    array[position:position + len(values)] = values
+
+    arrays[name] = array
+
+
+def convert_leap_csv(csv_path, path=None, leap_df=None, chunksize=50000):
+    """
+    Writes a leap data csv to a memory-mappable columnar store. The csv stays the archival copy, the store can
+    always be rebuilt from it. The csv is converted in chunks, so memory does not grow with the recording length.
+
+            Parameters:
+                    csv_path (str): *_leap_data.csv file.
+                    path (str): Store directory, defaults to store_path(csv_path).
+                    leap_df (pandas dataframe): The already parsed csv, to avoid parsing it again.
+                    chunksize (int): Rows converted at a time.
+
+            Returns:
+                    path (str): Store directory.
+    """
+
+    logging.info("Converting {} to a columnar store".format(csv_path))
+
+    path = path or store_path(csv_path)
+
+    if leap_df is None:
+        schema = Ls.LeapSchema.from_csv(csv_path)  # refuse to store an incomplete file
+        rows = _count_rows(csv_path)
+        chunks = pd.read_csv(csv_path, chunksize=chunksize)
+    else:
+        schema = Ls.LeapSchema.from_dataframe(leap_df)
+        rows = len(leap_df)
+        chunks = [leap_df]
+
+    # Written to a temporary directory first, so that a half written store is never opened.
+    temp_path = path + ".tmp"
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+
+    arrays = {name: None for name in schema.columns}
+    categories = {}
+    position = 0
+    start = None
+    stop = None
+
+    for chunk in chunks:
+        for name in schema.columns:
+            values = chunk[name]
+
+            if not pd.api.types.is_numeric_dtype(values.dtype):
+                # Strings, such as hand_type, are stored as integer codes
+                values = values.astype(str)
+                mapping = categories.setdefault(name, {})
+                for category in values.unique():
+                    mapping.setdefault(category, len(mapping))
+                values = values.map(mapping).to_numpy(dtype=np.int16)
+            else:
+                values = values.to_numpy()
+
+            _write_column(arrays, name, os.path.join(temp_path, name + ".npy"), values, position, rows)
+
+        if len(chunk):
+            start = min(chunk['timestamp'].min(), start) if start is not None else chunk['timestamp'].min()
+            stop = max(chunk['timestamp'].max(), stop) if stop is not None else chunk['timestamp'].max()
+
+        position += len(chunk)
+
+    # Each memmap is released before its file is rewritten, and all of them before the directory is renamed, as
+    # Windows cannot replace or move a file that is still mapped.
+    columns = {}
+    for name in schema.columns:
+        file = os.path.join(temp_path, name + ".npy")
+        array = arrays.pop(name)
+
+        if array is None:
+            dtype = np.empty(0).dtype
+            np.save(file, np.empty(0))
+        elif position != rows:
+            # Blank lines counted as rows, rewrite with the parsed length
+            values = np.array(array[:position])
+            del array
+            dtype = values.dtype
+            np.save(file, values)
+        else:
+            array.flush()
+            dtype = array.dtype
+            del array
+
+        columns[name] = {"file": name + ".npy", "dtype": dtype.str}
+        if name in categories:
+            columns[name]["categories"] = sorted(categories[name], key=categories[name].get)
+
+    header = {"version": STORE_VERSION,
+              "source": os.path.basename(csv_path),
+              "source_size": os.path.getsize(csv_path),
+              "source_mtime": os.path.getmtime(csv_path),
+              "rows": position,
+              "time_span": {"start": None if start is None else int(start),
+                            "stop": None if stop is None else int(stop)},
+              "order": schema.columns,
+              "columns": columns}
+
+    with open(os.path.join(temp_path, HEADER_FILE), "w") as f:
+        json.dump(header, f, indent=1)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(temp_path, path)
+
+    return path
+
+
+class LeapStore():
+    """
+    A converted leap recording. Columns are memory-mapped when first used, so opening a store only reads the header
+    and only the pages of the columns that are used are ever read from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, HEADER_FILE)) as f:
+            self.header = json.load(f)
+
+        if self.header.get("version") != STORE_VERSION:
+            raise ValueError("Unsupported leap store version {} in {}".format(self.header.get("version"), path))
+
+        self.columns = self.header["order"]
+        self.rows = self.header["rows"]
+        self.time_span = (self.header["time_span"]["start"], self.header["time_span"]["stop"])
+
+        self._arrays = {}
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, name):
+        return name in self.header["columns"]
+
+    def get_array(self, name):
+        """
+        Returns a read only memory-mapped array of a column. String columns are returned as integer codes.
+        """
+        if name not in self._arrays:
+            column = self.header["columns"][name]
+            self._arrays[name] = np.load(os.path.join(self.path, column["file"]), mmap_mode='r')
+
+        return self._arrays[name]
+
+    def get_column(self, name):
+        """
+        Returns a column as a pandas Series, string columns as categoricals.
+        """
+        column = self.header["columns"][name]
+        array = self.get_array(name)
+
+        if "categories" in column:
+            return pd.Series(pd.Categorical.from_codes(array, categories=column["categories"]), name=name)
+
+        return pd.Series(array, name=name, copy=False)
+
+    def read_rows(self, start, stop, columns=None):
+        """
+        Returns rows start to stop of the selected columns, in file order, as a dataframe. All columns if columns is
+        None. Only those rows of those columns are read from disk.
+        """
+        columns = self.columns if columns is None else [name for name in self.columns if name in set(columns)]
+
+        data = {}
+        for name in columns:
+            column = self.header["columns"][name]
+            values = np.array(self.get_array(name)[start:stop])
+
+            if "categories" in column:
+                values = pd.Categorical.from_codes(values, categories=column["categories"])
+
+            data[name] = values
+
+        return pd.DataFrame(data, columns=columns)
+
+    def read_window(self, start, stop, profile="full", exact=True):
+        """
+        Returns the rows with start <= timestamp <= stop, in leap microseconds, with the columns of a load profile.
+        The rows are found with a binary search of the timestamp column, which is in time order as recorded. With
+        exact=False WINDOW_MARGIN is added either side, as LeapIndex.read_window returns whole buckets, so that a
+        store can be read in place of an index.
+        """
+        if not exact:
+            start, stop = start - WINDOW_MARGIN, stop + WINDOW_MARGIN
+
+        timestamp = self.get_array("timestamp")
+
+        return self.read_rows(np.searchsorted(timestamp, start, side='left'),
+                              np.searchsorted(timestamp, stop, side='right'), Ll.get_profile_columns(profile))
+
+    def to_dataframe(self, columns=None):
+        """
+        Returns the selected columns, in file order, as a dataframe. All columns if columns is None.
+        """
+        columns = self.columns if columns is None else [name for name in self.columns if name in set(columns)]
+
+        return pd.DataFrame({name: self.get_column(name) for name in columns}, columns=columns)
+
+
+def open_leap_store(csv_path, convert=True):
+    """
+    Opens the store of a leap data csv, converting the csv first if the store is missing or out of date.
+
+            Parameters:
+                    csv_path (str): *_leap_data.csv file.
+                    convert (bool): If False, a missing or out of date store raises FileNotFoundError.
+
+            Returns:
+                    store (LeapStore): The opened store.
+    """
+
+    if not is_current(csv_path):
+        if not convert:
+            raise FileNotFoundError("No current leap store for {}".format(csv_path))
+        convert_leap_csv(csv_path)
+
+    return LeapStore(store_path(csv_path))
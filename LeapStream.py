@@ -0,0 +1,154 @@
+import pandas as pd
+import numpy as np
+
+import LeapSchema as Ls
+import LeapLoader as Ll
+import LeapIndex as Lx
+import LeapStore as Lst
+
+import logging
+
+
+def iter_leap_chunks(csv_path, chunksize=10000, profile="full"):
+    """
+    Yields a leap data csv as dataframes of at most chunksize rows. The header is checked against the schema before
+    any data is read.
+
+            Parameters:
+                    csv_path (str): *_leap_data.csv file.
+                    chunksize (int): Maximum rows per chunk.
+                    profile (str): Column profile to read, see LeapLoader.PROFILES.
+
+            Returns:
+                    chunks (iterator of pandas dataframes): The recording, in file order.
+    """
+
+    logging.info("Streaming {} in chunks of {} rows".format(csv_path, chunksize))
+
+    Ls.LeapSchema.from_csv(csv_path)
+
+    # The pyarrow engine cannot read in chunks, so the C parser is always used here
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize, **Ll.get_read_options(profile)):
+        yield chunk
+
+
+def open_window_reader(csv_path):
+    """
+    Returns the columnar store of a leap data csv if it is current, otherwise its sidecar index, built if missing.
+    Both read time windows with read_window(start, stop, profile, exact).
+    """
+    if Lst.is_current(csv_path):
+        return Lst.open_leap_store(csv_path, convert=False)
+
+    return Lx.open_leap_index(csv_path)
+
+
+class TrialWindowRouter():
+    """
+    Collects the samples that fall in each trial window as the chunks stream past. Only the samples inside a window
+    are kept, so memory depends on the trial lengths and not on the recording length.
+    """
+
+    def __init__(self, trials, columns=()):
+        """
+                Parameters:
+                        trials (pandas dataframe): Indexed by trial name, with 'start' and 'stop' columns in the
+                                                   same time base as the streamed timestamps.
+                        columns (list of str): Columns routed besides timestamp, which windows without samples
+                                               still have.
+        """
+        self.names = list(trials.index)
+        self.starts = trials['start'].to_numpy(dtype=float)
+        self.stops = trials['stop'].to_numpy(dtype=float)
+        self.parts = {name: [] for name in self.names}
+        self.columns = ['timestamp'] + list(columns)
+
+    def route(self, timestamp, **columns):
+        """
+        Adds the samples of a chunk to the windows they fall in. Timestamps must be increasing within the chunk.
+        """
+        if len(timestamp) == 0:
+            return
+
+        starts = np.searchsorted(timestamp, self.starts, side='left')
+        stops = np.searchsorted(timestamp, self.stops, side='right')
+
+        for name, start, stop in zip(self.names, starts, stops):
+            if stop > start:
+                part = {'timestamp': timestamp[start:stop]}
+                part.update({key: value[start:stop] for key, value in columns.items()})
+                self.parts[name].append(part)
+
+    def get_trials(self):
+        """
+        Returns a dictionary of trial name to a dataframe of the samples in its window.
+        """
+        trials = {}
+        for name, parts in self.parts.items():
+            if parts:
+                trials[name] = pd.DataFrame({key: np.concatenate([part[key] for part in parts]) for key in parts[0]})
+            else:
+                trials[name] = pd.DataFrame(columns=self.columns)  # no samples, but the same columns
+
+        return trials
+
+
+# Columns of each streamed trial besides timestamp
+ROUTED_COLUMNS = ["hand_id", "euclidean_distance"] + Ls.vector_columns("palm_position")
+
+
+def stream_trial_kinematics(csv_path, trials, clock, handedness, chunksize=10000, use_index=False):
+    """
+    Reads a leap data csv in bounded chunks and returns the palm position and its distance from the sensor origin in
+    each trial window. Derivatives are left to the caller, e.g. LeapKinematics.smoothed_derivatives over each trial.
+
+            Parameters:
+                    csv_path (str): *_leap_data.csv file.
+                    trials (pandas dataframe): Indexed by name, with 'start' and 'stop' in epoch seconds.
+                    clock (LeapClock.ClockSync): Converts leap timestamps to epoch seconds.
+                    handedness (str): "right" or "left", only this hand is used.
+                    chunksize (int): Maximum rows held in memory at a time.
+                    use_index (bool): Seek to each trial with the sidecar index instead of reading the whole file.
+                                      A current columnar store, see LeapStore, is always read in place of the csv.
+
+            Returns:
+                    trials (dict): Trial name to a dataframe with timestamp and ROUTED_COLUMNS.
+    """
+
+    logging.info("Streaming trial kinematics")
+
+    if Lst.is_current(csv_path):
+        store = Lst.open_leap_store(csv_path, convert=False)
+
+        # Only the report columns of each trial are read
+        windows = [(trials.loc[[name]],
+                    [store.read_window(clock.to_leap(row['start']), clock.to_leap(row['stop']), profile="report")])
+                   for name, row in trials.iterrows()]
+    elif use_index:
+        index = Lx.open_leap_index(csv_path)
+
+        windows = [(trials.loc[[name]],
+                    [index.read_window(clock.to_leap(row['start']), clock.to_leap(row['stop']), profile="report")])
+                   for name, row in trials.iterrows()]
+    else:
+        windows = [(trials, iter_leap_chunks(csv_path, chunksize, profile="report"))]
+
+    results = {}
+
+    for window_trials, chunks in windows:
+        router = TrialWindowRouter(window_trials, ROUTED_COLUMNS)
+
+        for chunk in chunks:
+            chunk = chunk[chunk['hand_type'] == handedness]
+
+            timestamp = clock.to_epoch(chunk['timestamp'].to_numpy())
+            position = chunk[['palm_position_x', 'palm_position_y', 'palm_position_z']].to_numpy(dtype=float)
+
+            distance = np.sqrt(np.einsum('ij,ij->i', position, position))
+
+            router.route(timestamp, hand_id=chunk['hand_id'].to_numpy(), euclidean_distance=distance,
+                         **{column: chunk[column].to_numpy() for column in Ls.vector_columns("palm_position")})
+
+        results.update(router.get_trials())
+
+    return results
@@ -0,0 +1,76 @@
+import numpy as np
+
+import logging
+
+
+class TrialWindows():
+    """
+    Every trial window of a recording, found once with np.searchsorted over the sorted timestamps.
+
+    A window is the rows with start <= timestamp <= stop, returned as a positional slice of the data, so no trial
+    copies the recording. The same windows can be used for plotting, videos and metrics.
+    """
+
+    def __init__(self, data_df, trials, column='timestamp'):
+        """
+                Parameters:
+                        data_df (pandas dataframe): Recorded data, in any order. It is sorted by time once if needed.
+                        trials (pandas dataframe): Indexed by trial name, with 'start' and 'stop' columns in the same
+                                                   time base as data_df[column].
+                        column (str): Time column of data_df.
+        """
+
+        logging.info("Finding {} trial windows".format(len(trials)))
+
+        timestamp = data_df[column].to_numpy()
+
+        if np.any(timestamp[1:] < timestamp[:-1]):
+            data_df = data_df.iloc[np.argsort(timestamp, kind='stable')]
+            timestamp = data_df[column].to_numpy()
+
+        self.data_df = data_df
+        self.trials = trials
+        self.timestamp = timestamp
+
+        self.starts = np.searchsorted(timestamp, trials['start'].to_numpy(), side='left')
+        self.stops = np.searchsorted(timestamp, trials['stop'].to_numpy(), side='right')
+        self.stops = np.maximum(self.starts, self.stops)  # a stop before its start is an empty window
+
+        self._positions = {name: i for i, name in enumerate(trials.index)}
+
+    def __len__(self):
+        return len(self.trials)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def get_bounds(self, name):
+        """
+        Returns the first row and one past the last row of a trial window.
+        """
+        i = self._positions[name]
+
+        return self.starts[i], self.stops[i]
+
+    def get_window(self, name):
+        """
+        Returns the rows of a trial window, a slice of the recorded data.
+        """
+        start, stop = self.get_bounds(name)
+
+        return self.data_df.iloc[start:stop]
+
+    def get_timestamps(self, name):
+        """
+        Returns the timestamps of a trial window, a view of the sorted timestamp array.
+        """
+        start, stop = self.get_bounds(name)
+
+        return self.timestamp[start:stop]
+
+    def windows(self):
+        """
+        Yields the name, trial row and data of every trial window, in trial order.
+        """
+        for (name, row), start, stop in zip(self.trials.iterrows(), self.starts, self.stops):
+            yield name, row, self.data_df.iloc[start:stop]
@@ -0,0 +1,345 @@
+import numpy as np
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import cv2
+
+import LeapFrames as Lf
+import LeapRaster as Lrr
+
+from concurrent.futures import ProcessPoolExecutor
+import threading
+import tempfile
+import queue
+import logging
+import os
+
+
+def _polyline(segments):
+    """
+    Joins segments into one polyline broken by NaN, so that every segment is drawn by a single artist.
+    """
+    gaps = np.full((len(segments), 1, 3), np.nan)
+
+    return np.concatenate((segments, gaps), axis=1).reshape(-1, 3)
+
+
+class HandVideoFigure():
+    """
+    A 3d figure of the tracked hands that is laid out once and redrawn for every video frame. Each hand is three
+    artists, the bones, the joints and the palm, whose 3d data is replaced for each frame. Frames are converted from
+    the canvas into one preallocated BGR buffer.
+    """
+
+    def __init__(self, width=500, height=400, dpi=100):
+        self.fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+
+        self.ax = Lrr.hand_axes(self.fig)
+
+        self.hand_artists = []
+
+        self.frame = np.empty((height, width, 3), dtype=np.uint8)
+
+    def _add_hand_artists(self):
+        empty = ([], [], [])
+
+        bones, = self.ax.plot(*empty, c='b')
+        joints, = self.ax.plot(*empty, c='r', linestyle='none', marker='o', markersize=4.5)
+        palm, = self.ax.plot(*empty, c='C0', linestyle='none', marker='o', markersize=10)
+
+        self.hand_artists.append((bones, joints, palm))
+
+    def draw_hands(self, joints, arm_joints, palm_position):
+        """
+        Replaces the hands drawn.
+
+                Parameters:
+                        joints (array): (k, 5, 4, 2, 3) joint positions of k hands.
+                        arm_joints (array): (k, 2, 3) arm joint positions.
+                        palm_position (array): (k, 3) palm positions.
+        """
+        while len(self.hand_artists) < len(joints):
+            self._add_hand_artists()
+
+        for i, (bones, joint_markers, palm) in enumerate(self.hand_artists):
+            if i >= len(joints):
+                for artist in (bones, joint_markers, palm):
+                    artist.set_visible(False)
+                continue
+
+            segments = Lrr.hand_segments(joints[i], arm_joints[i])
+            line = _polyline(segments)
+            points = segments[:21].reshape(-1, 3)  # the ends of every bone and the arm
+
+            bones.set_data_3d(line[:, 0], line[:, 1], line[:, 2])
+            joint_markers.set_data_3d(points[:, 0], points[:, 1], points[:, 2])
+            palm.set_data_3d(palm_position[i, 0:1], palm_position[i, 1:2], palm_position[i, 2:3])
+
+            for artist in (bones, joint_markers, palm):
+                artist.set_visible(True)
+
+    def render(self):
+        """
+        Draws the figure and returns the frame as a BGR image. The same buffer is reused by every call.
+        """
+        self.canvas.draw()
+
+        cv2.cvtColor(np.asarray(self.canvas.buffer_rgba()), cv2.COLOR_RGBA2BGR, dst=self.frame)
+
+        return self.frame
+
+
+# Hand video renderers. Each takes the frame width and height, and has draw_hands and render.
+RENDERERS = {"matplotlib": HandVideoFigure,
+             "opencv": Lrr.HandRasteriser}
+
+
+def _open_writer(filename, codec, framerate, width, height):
+    """
+    Returns a cv2.VideoWriter for filename. OpenCV only logs when it cannot open a video, after which every frame
+    written is silently dropped, so this raises instead.
+    """
+    out = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*codec), framerate, (width, height))
+
+    if not out.isOpened():
+        raise IOError("Unable to open {} to write {} video".format(filename, codec))
+
+    return out
+
+
+# Frames waiting between the stages of the video pipeline
+QUEUE_SIZE = 8
+
+
+def _put(stage_queue, item, stop):
+    """
+    Puts item on a bounded queue, blocking while it is full. Returns False if the pipeline stopped meanwhile.
+    """
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+
+    return False
+
+
+def _get(stage_queue, stop):
+    """
+    Gets the next item of a queue, blocking while it is empty. Returns None if the pipeline stopped meanwhile.
+    """
+    while not stop.is_set():
+        try:
+            return stage_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+
+    return None
+
+
+def _write_frames(out, video_figure, hand_frames, firsts, lasts, queue_size=QUEUE_SIZE, progress=None):
+    """
+    Draws and writes one frame per (first, last) range of hands.
+
+    With a queue_size, looking up the hands of each frame, drawing and encoding run in three threads joined by
+    bounded queues, so encoding overlaps with drawing. Frames are drawn into a fixed set of preallocated buffers
+    that the encoder hands back once written, and the drawing thread waits for a free buffer when encoding falls
+    behind. With a queue_size of 0 the stages run one after another in this thread.
+    """
+    if not queue_size:
+        for first, last in zip(firsts, lasts):
+            video_figure.draw_hands(hand_frames.joints[first:last], hand_frames.arm_joints[first:last],
+                                    hand_frames.palm_position[first:last])
+
+            out.write(video_figure.render())
+
+            if progress is not None:
+                progress()
+        return
+
+    hands_queue = queue.Queue(queue_size)
+    frames_queue = queue.Queue(queue_size)
+
+    # One buffer for each queued frame, plus the one being drawn and the one being encoded
+    free_buffers = queue.Queue()
+    for _ in range(queue_size + 2):
+        free_buffers.put(np.empty_like(video_figure.frame))
+
+    stop = threading.Event()
+    errors = []
+
+    def generate():
+        for first, last in zip(firsts, lasts):
+            hands = (hand_frames.joints[first:last], hand_frames.arm_joints[first:last],
+                     hand_frames.palm_position[first:last])
+
+            if not _put(hands_queue, hands, stop):
+                return
+
+        _put(hands_queue, None, stop)
+
+    def draw():
+        while True:
+            hands = _get(hands_queue, stop)
+            if hands is None:
+                break
+
+            buffer = _get(free_buffers, stop)
+            if buffer is None:
+                return
+
+            video_figure.draw_hands(*hands)
+            np.copyto(buffer, video_figure.render())
+
+            if not _put(frames_queue, buffer, stop):
+                return
+
+        _put(frames_queue, None, stop)
+
+    def run(stage):
+        try:
+            stage()
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=run, args=(stage,), daemon=True) for stage in (generate, draw)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            buffer = _get(frames_queue, stop)
+            if buffer is None:
+                break
+
+            out.write(buffer)
+            free_buffers.put(buffer)
+
+            if progress is not None:
+                progress()
+    finally:
+        # Also unblocks the other stages if encoding failed
+        stop.set()
+
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+def _render_segment(filename, framerate, hand_frames, firsts, lasts, width, height, renderer, queue_size):
+    """
+    Renders a run of frames to a lossless FFV1 video, in a worker process of make_leap_video.
+    """
+    video_figure = RENDERERS[renderer](width, height)
+
+    out = _open_writer(filename, 'FFV1', framerate, width, height)
+
+    try:
+        _write_frames(out, video_figure, hand_frames, firsts, lasts, queue_size)
+    finally:
+        out.release()
+
+    return filename
+
+
+def _stitch(out, segment_filenames, progress=None):
+    """
+    Copies the frames of each segment video into out, in order.
+    """
+    for segment_filename in segment_filenames:
+        capture = cv2.VideoCapture(segment_filename)
+
+        if not capture.isOpened():
+            raise IOError("Unable to read the video segment {}".format(segment_filename))
+
+        try:
+            while True:
+                read, frame = capture.read()
+                if not read:
+                    break
+                out.write(frame)
+
+                if progress is not None:
+                    progress()
+        finally:
+            capture.release()
+
+
+def _render_segments(out, framerate, hand_frames, firsts, lasts, width, height, renderer, queue_size, workers,
+                     directory, progress=None):
+    """
+    Splits the frames into one contiguous segment per worker, renders the segments in a pool of processes and
+    stitches them into out in order.
+    """
+    segments = np.array_split(np.arange(len(firsts)), min(workers, len(firsts)))
+
+    with tempfile.TemporaryDirectory(dir=directory) as segment_directory, \
+            ProcessPoolExecutor(max_workers=len(segments)) as executor:
+
+        futures = []
+
+        for i, segment in enumerate(segments):
+            # Each worker is only sent the hands of its own frames
+            first, last = firsts[segment[0]], lasts[segment[-1]]
+
+            futures.append(executor.submit(_render_segment, os.path.join(segment_directory, "{}.avi".format(i)),
+                                           framerate, hand_frames[first:last], firsts[segment] - first,
+                                           lasts[segment] - first, width, height, renderer, queue_size))
+
+        _stitch(out, [future.result() for future in futures], progress)
+
+
+def make_leap_video(filename, framerate, data, timestamps, width=500, height=400, renderer="matplotlib", workers=1,
+                    queue_size=QUEUE_SIZE, progress=None):
+    """
+    Creates a video from leap motion data, at specified timestamps, drawing every frame on one reused figure or
+    frame.
+
+            Parameters:
+                    filename (str): filename, must contain extension.
+                    framerate (float): frames per second the video will play
+                    data (pandas dataframe): leap motion data indexed by timestamp, at least the "video" profile,
+                                             e.g. from LeapReport.interpolate_leap_for_timestamps.
+                    timestamps (array): timestamps of the frames, the same format as the index of data. Frames
+                                        without hands are left empty.
+                    renderer (str): "matplotlib" for mplot3d figures, "opencv" for the much faster rasteriser with
+                                    the same camera, see RENDERERS.
+                    workers (int): Processes rendering the frames, one per CPU if None. With more than one, the
+                                   frames are split into contiguous segments rendered to lossless temporary videos
+                                   next to filename, which are then encoded in order into filename.
+                    queue_size (int): Frames queued between the lookup, drawing and encoding threads, see
+                                      _write_frames. 0 runs them one after another.
+                    progress (callable): Called with no arguments after each frame is written to filename, e.g.
+                                         tqdm.update.
+
+            Returns:
+                    None
+    """
+
+    logging.info("making leap video")
+
+    # Hands grouped by timestamp once, so the hands of every frame are a slice found with a binary search
+    tracking_frames = Lf.TrackingFrames.from_dataframe(data.reset_index(), key="timestamp")
+    hand_frames = tracking_frames.hand_frames
+
+    timestamps = np.asarray(timestamps)
+    firsts, lasts = tracking_frames.get_bounds(timestamps)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    out = _open_writer(filename, 'MP4V', framerate, width, height)
+
+    try:
+        if workers > 1 and len(timestamps) > 1:
+            _render_segments(out, framerate, hand_frames, firsts, lasts, width, height, renderer, queue_size,
+                             workers, os.path.dirname(os.path.abspath(filename)), progress)
+        else:
+            _write_frames(out, RENDERERS[renderer](width, height), hand_frames, firsts, lasts, queue_size, progress)
+    finally:
+        out.release()
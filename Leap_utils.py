@@ -1,14 +1,15 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
 from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.figure import Figure
 import numpy as np
 import cv2
 
 from tqdm import tqdm
-import glob
-from PIL import Image
+
+import LeapSchema as Ls
+import LeapRaster as Lrr
 
 
 def indent_string(string):
@@ -174,69 +175,47 @@ class LEAP_TRACKING_EVENT():
 
 
 
-def get_palm(row):
-    # Palm
-
-    palm_position = LEAP_VECTOR(row["palm_position_x"],
-                                row["palm_position_y"],
-                                row["palm_position_z"])
-
-    palm_stabilized_position = LEAP_VECTOR(row["palm_stabilized_position_x"],
-                                           row["palm_stabilized_position_y"],
-                                           row["palm_stabilized_position_z"])
+# Column names of the palm, of each digit and of each bone, from LeapSchema. They are built once here, so the row
+# getters below only look them up.
+PALM_VECTOR_COLUMNS = [Ls.vector_columns("palm_" + vector) for vector in Ls.PALM_VECTORS]
+PALM_ORIENTATION_COLUMNS = Ls.quaternion_columns("palm_orientation")
 
-    palm_velocity = LEAP_VECTOR(row["palm_velocity_x"],
-                                row["palm_velocity_y"],
-                                row["palm_velocity_z"])
+DIGIT_COLUMNS = {digit: (Ls.column_name(digit, "finger_id"), Ls.column_name(digit, "is_extended"),
+                         [Ls.column_name(digit, bone) for bone in Ls.BONE_NAMES])
+                 for digit in Ls.DIGIT_NAMES}
 
-    palm_normal = LEAP_VECTOR(row["palm_normal_x"],
-                              row["palm_normal_y"],
-                              row["palm_normal_z"])
+BONE_COLUMNS = {name: Ls.bone_columns(name)
+                for name in ["arm"] + [bone for digit in Ls.DIGIT_NAMES for bone in DIGIT_COLUMNS[digit][2]]}
 
-    palm_width = row["palm_width"]
 
-    palm_direction = LEAP_VECTOR(row["palm_direction_x"],
-                                 row["palm_direction_y"],
-                                 row["palm_direction_z"])
+def _vector(row, columns):
+    return LEAP_VECTOR(row[columns[0]], row[columns[1]], row[columns[2]])
 
-    palm_orientation = LEAP_QUARTERNION(row["palm_orientation_w"],
-                                        row["palm_orientation_x"],
-                                        row["palm_orientation_y"],
-                                        row["palm_orientation_z"], )
 
-    return LEAP_PALM(palm_position, palm_stabilized_position, palm_velocity, palm_normal,
-                     palm_width, palm_direction, palm_orientation)
+def _quaternion(row, columns):
+    return LEAP_QUARTERNION(w=row[columns[0]], x=row[columns[1]], y=row[columns[2]], z=row[columns[3]])
 
 
-def get_bone(row, name):
-    prev_joint = LEAP_VECTOR(row[name + "_prev_joint_x"],
-                             row[name + "_prev_joint_y"],
-                             row[name + "_prev_joint_z"])
+def get_palm(row):
+    position, stabilized_position, velocity, normal, direction = [_vector(row, columns)
+                                                                   for columns in PALM_VECTOR_COLUMNS]
 
-    next_joint = LEAP_VECTOR(row[name + "_next_joint_x"],
-                             row[name + "_next_joint_y"],
-                             row[name + "_next_joint_z"])
+    return LEAP_PALM(position, stabilized_position, velocity, normal, row["palm_width"], direction,
+                     _quaternion(row, PALM_ORIENTATION_COLUMNS))
 
-    width = row[name + "_width"]
 
-    rotation = LEAP_QUARTERNION(row[name + "_rotation_w"],
-                                row[name + "_rotation_x"],
-                                row[name + "_rotation_y"],
-                                row[name + "_rotation_z"])
+def get_bone(row, name):
+    columns = BONE_COLUMNS[name] if name in BONE_COLUMNS else Ls.bone_columns(name)
 
-    return LEAP_BONE(prev_joint, next_joint, width, rotation)
+    # prev_joint xyz, next_joint xyz, width, rotation wxyz
+    return LEAP_BONE(_vector(row, columns[0:3]), _vector(row, columns[3:6]), row[columns[6]],
+                     _quaternion(row, columns[7:11]))
 
 
 def get_digit(row, name):
-    finger_id = row[name + "_finger_id"]
-    is_extended = row[name + "_is_extended"]
-
-    metacarpal = get_bone(row, name + "_metacarpal")
-    proximal = get_bone(row, name + "_proximal")
-    intermediate = get_bone(row, name + "_intermediate")
-    distal = get_bone(row, name + "_distal")
+    finger_id, is_extended, bones = DIGIT_COLUMNS[name]
 
-    return LEAP_DIGIT(finger_id, is_extended, metacarpal, proximal, intermediate, distal)
+    return LEAP_DIGIT(row[finger_id], row[is_extended], *[get_bone(row, bone) for bone in bones])
 
 
 def get_hand(row):
@@ -264,206 +243,81 @@ def get_tracking_event(rows):
     # 1. How many hands are in the row?
     # 2. Get hands for each. Everything else should be the same
 
-    rows.to_csv("rows.csv")
+    # Records are plain dicts, which are much cheaper to index than a Series per row, and the column names are
+    # looked up from LeapSchema rather than built for every row. For many frames use LeapFrames.TrackingFrames, which
+    # groups the whole recording at once.
 
-    hands = []
+    records = rows.to_dict("records")
 
-    for index, row in rows.iterrows():
-        hands.append(get_hand(row))
-
-
-    row = rows.iloc[0] # Everything should be the same between rows
+    hands = [get_hand(row) for row in records]
 
+    row = records[0]  # Everything should be the same between rows
 
     frame_id = row['frame_id']
-    timestamp = 1
+    timestamp = row['timestamp']
     tracking_frame_id = row['tracking_frame_id']
     nHands = row['nHands']
     framerate = row['framerate']
 
     return LEAP_TRACKING_EVENT(frame_id, timestamp, tracking_frame_id, nHands, hands, framerate)
 
-def plot_hand(hand: LEAP_HAND, ax):
-    
-    def plot_bone(bone: LEAP_BONE, ax):
-        prev_bone = bone.prev_joint.v
-        next_bone = bone.next_joint.v
-
-        ax.scatter3D(bone.prev_joint.x, bone.prev_joint.y, bone.prev_joint.z, c='r')
-        ax.scatter3D(bone.next_joint.x, bone.next_joint.y, bone.next_joint.z, c='r')
-        ax.plot3D([bone.prev_joint.x, bone.next_joint.x],
-                  [bone.prev_joint.y, bone.next_joint.y],
-                  [bone.prev_joint.z, bone.next_joint.z], c='b')
-    
-    # Plotting digits and arm
-    
-    for digit in hand.digits:
-         for bone in digit.bones:
-                plot_bone(bone,ax)
-    
-    
-    plot_bone(hand.arm, ax)
-    
-    
-    # Making the palm position more visible than others
-
-    ax.scatter3D(hand.palm.position.x,
-                 hand.palm.position.y,
-                 hand.palm.position.z, s=[100])
-
-    # Ploting outline of the hand
-    
-    ax.plot3D([hand.index.metacarpal.next_joint.x, hand.middle.metacarpal.next_joint.x],
-              [hand.index.metacarpal.next_joint.y, hand.middle.metacarpal.next_joint.y],
-              [hand.index.metacarpal.next_joint.z, hand.middle.metacarpal.next_joint.z], c='b')
-
-    ax.plot3D([hand.middle.metacarpal.next_joint.x, hand.ring.metacarpal.next_joint.x],
-              [hand.middle.metacarpal.next_joint.y, hand.ring.metacarpal.next_joint.y],
-              [hand.middle.metacarpal.next_joint.z, hand.ring.metacarpal.next_joint.z], c='b')
-
-    ax.plot3D([hand.ring.metacarpal.next_joint.x, hand.pinky.metacarpal.next_joint.x],
-              [hand.ring.metacarpal.next_joint.y, hand.pinky.metacarpal.next_joint.y],
-              [hand.ring.metacarpal.next_joint.z, hand.pinky.metacarpal.next_joint.z], c='b')
-
-
-def plot_events(tracking_events):
-    for event in tqdm(tracking_events):
-
-        # # make a Figure and attach it to a canvas.
-        fig = Figure(figsize=(5, 4), dpi=100)
-        canvas = FigureCanvasAgg(fig)
+def hand_points(hand: LEAP_HAND):
+    """
+    Returns the joints of a hand as a (42, 3) array: the prev and next joint of every bone of every digit, thumb to
+    pinky and metacarpal to distal, then the two ends of the arm. LeapSchema.HAND_SEGMENTS indexes these points.
+    """
+    bones = [bone for digit in hand.digits for bone in digit.bones] + [hand.arm]
 
-        fig = plt.figure(figsize=(5, 4), dpi=100)
-        # canvas = FigureCanvasAgg(fig)
-        ax = fig.add_subplot(111, projection='3d')
+    return np.array([joint.v for bone in bones for joint in (bone.prev_joint, bone.next_joint)], dtype=float)
 
-        ax.set_xlim3d(-150, 150)
-        ax.set_ylim3d(-150, 150)
-        ax.set_zlim3d(-150, 150)
 
-        ax.view_init(125, -140)
-
-        plt.axis('off')
-
-        for hand in event.hands:
-            plot_hand(hand, ax)
-        
-            # Retrieve a view on the renderer buffer
-            canvas.draw()
-            buf = canvas.buffer_rgba()
-
-            # convert to a NumPy array
-
-            X = np.asarray(buf)
-
-            img = Image.fromarray(X.astype(np.uint8))
-            opencvImage = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-            #print(opencvImage.shape)
-            #cv2.imshow("hello", opencvImage)
-            #cv2.waitKey(0)
-
-            out.write(opencvImage)
-            plt.close(fig)
-        
-        out.release()
-        plt.show()
-
-if __name__ == "__main__":
-
-    example_path = r"E:\Ruijin\Recording\20210621-132108_songshanying"
-
-    recording_id = example_path.split("\\")[-1]
-
-    leap_list = glob.glob(example_path + r"\*_leap.csv")
-
-    leap_recordings = {}
-    for x in leap_list:
-        rm_path = x.replace(example_path + "\\", "")
-        rm_id = rm_path.replace(recording_id + "_", "")
-        leap_df = pd.read_csv(x)
-
-    # file = r"C:\Users\Cam\Downloads\Ruijin_test\20210529-092302_z963014\20210529-092302_z963014_20210529-093406_visual_leap.csv"
-
-    tracking_events = []
+def plot_hand(hand: LEAP_HAND, ax):
 
-    # Current tracking frame
-    prev_tracking_frame = None
+    # One collection for all bones and the outline of the hand, and one scatter for all joints, rather than an
+    # artist per bone. The palm position is the last point of the scatter, bigger than the others, so that it is still
+    # drawn in depth order with the joints.
 
-    temp_hand = None
+    points = hand_points(hand)
 
-    for index, row in leap_df.iterrows():
+    ax.add_collection3d(Line3DCollection(points[Ls.HAND_SEGMENTS], colors='b',
+                                         linewidths=plt.rcParams['lines.linewidth']))
 
-        prev_tracking_frame = row['frame_id']
+    points = np.concatenate((points, [hand.palm.position.v]))
 
-        frame_id = row['frame_id']
-        timestamp = row['timestamp']
-        tracking_frame_id = row['tracking_frame_id']
-        nHands = row['nHands']
-        framerate = row['framerate']
-        hand = get_hand(row)
+    sizes = np.full(len(points), 20)  # the scatter3D default
+    sizes[-1] = 100
 
-        if nHands == 1:
-            tracking_events.append(LEAP_TRACKING_EVENT(frame_id, timestamp, tracking_frame_id, nHands, [hand],
-                                                       framerate))
-        else:
-            if row['frame_id'] == prev_tracking_frame:
-                # There has been another hand tracked
-                tracking_events.append(LEAP_TRACKING_EVENT(frame_id, timestamp, tracking_frame_id, nHands,
-                                                           [temp_hand, hand], framerate))
-            else:
-                temp_hand = hand
+    colours = ['r'] * (len(points) - 1) + ['C0']
 
-    # Define the codec and create VideoWriter object
-    fourcc = cv2.VideoWriter_fourcc(*'XVID')
-    out = cv2.VideoWriter('output.avi', fourcc, 120.0, (500, 400))
+    # Single point scatters were never depth shaded
+    ax.scatter3D(points[:, 0], points[:, 1], points[:, 2], s=sizes, c=colours, depthshade=False)
 
-    count = 0
 
+def plot_events(tracking_events, out):
+    """
+    Draws each tracking event as one frame of an open cv2.VideoWriter, out, of 500 x 400 frames. LeapReplay renders
+    whole sessions much faster.
+    """
     for event in tqdm(tracking_events):
 
-        # # make a Figure and attach it to a canvas.
+        # make a Figure and attach it to a canvas.
         fig = Figure(figsize=(5, 4), dpi=100)
         canvas = FigureCanvasAgg(fig)
 
-        fig = plt.figure(figsize=(5, 4), dpi=100)
-        # canvas = FigureCanvasAgg(fig)
-        ax = fig.add_subplot(111, projection='3d')
-
-        ax.set_xlim3d(-150, 150)
-        ax.set_ylim3d(-150, 150)
-        ax.set_zlim3d(-150, 150)
-
-        ax.view_init(125, -140)
+        ax = Lrr.hand_axes(fig, limits=(-150, 150), axis=False)
 
-        #
-        plt.axis('off')
-        #
         for hand in event.hands:
             plot_hand(hand, ax)
-        
-            # Retrieve a view on the renderer buffer
-            canvas.draw()
-            buf = canvas.buffer_rgba()
-            # convert to a NumPy array
-            X = np.asarray(buf)
-
-            img = Image.fromarray(X.astype(np.uint8))
-            opencvImage = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-            #print(opencvImage.shape)
-            #cv2.imshow("hello", opencvImage)
-            #cv2.waitKey(0)
-
-            out.write(opencvImage)
-        plt.close(fig)
-        
-        
-        out.release()
 
-        # fig = plt.figure()
-        # ax = fig.add_subplot(111, projection='3d')
-        # example_event = tracking_events[10]
-        # example_hand = example_event.hands[0]
-        # plot_hand(example_hand, ax)
+        # Retrieve a view on the renderer buffer
+        canvas.draw()
+
+        out.write(cv2.cvtColor(np.asarray(canvas.buffer_rgba()), cv2.COLOR_RGBA2BGR))
+
+
+if __name__ == "__main__":
 
-        plt.show()
+    # Replays a session directory to a video, see LeapReplay.py --help
+    import LeapReplay as Lrp
 
+    Lrp.main()
@@ -17,6 +17,9 @@ from PupilHandler import PupilHandler
 from LeapHandler import LeapHandler
 
 import LeapReport as Lr
+import LeapSchema as Ls
+import LeapStore as Lst
+import LeapIndex as Lx
 
 import logging
 import time
@@ -266,13 +269,43 @@ class TrialWizard(Qtw.QWizard):
 
         leap_data = "temp_recordings/" + self.startingTime + "_leap_data.csv"
 
-        for drive in self.drives:
-            shutil.copyfile(leap_data, drive + path + filename + "_leap_data.csv")
+        archived_leap_data = self.drives[0] + path + filename + "_leap_data.csv"
+
+        shutil.copyfile(leap_data, archived_leap_data)
+
+        # Columnar copy next to the csv, so that later processing can open the session without parsing the csv, and
+        # an index of byte offsets so that single trials can be read straight from the csv.
+        # Neither loads the csv whole. Both are made once, on the first drive, and copied with the csv to the others.
+
+        try:
+            Lst.convert_leap_csv(archived_leap_data)
+        except:
+            logging.exception("Unable to convert leap data on drive {}".format(self.drives[0]))
 
-        leap_data_df = pd.read_csv(leap_data)
+        try:
+            Lx.build_leap_index(archived_leap_data)
+        except:
+            logging.exception("Unable to index leap data on drive {}".format(self.drives[0]))
+
+        for drive in self.drives[1:]:
+            drive_leap_data = drive + path + filename + "_leap_data.csv"
+
+            # copy2 keeps the modification time, which the store and the index check against their csv
+            shutil.copy2(archived_leap_data, drive_leap_data)
+
+            try:
+                if os.path.isdir(Lst.store_path(archived_leap_data)):
+                    shutil.copytree(Lst.store_path(archived_leap_data), Lst.store_path(drive_leap_data))
+
+                if os.path.exists(Lx.index_path(archived_leap_data)):
+                    shutil.copy2(Lx.index_path(archived_leap_data), Lx.index_path(drive_leap_data))
+            except:
+                logging.exception("Unable to copy the leap data store and index to drive {}".format(drive))
 
         os.remove(leap_data)
 
+        leap_data = archived_leap_data  # read by the report
+
         # Create report
 
 
@@ -314,9 +347,12 @@ class TrialWizard(Qtw.QWizard):
             os.mkdir("report")
 
         try:
-            Lr.save_report(leap_timestamps_df, leap_data_df, timestamps_data_df, intro["handedness"].lower())
+            Lr.save_report_from_csv(leap_timestamps_df, leap_data, timestamps_data_df, intro["handedness"].lower(),
+                                    use_index=True)
+        except Ls.LeapSchemaError as e:
+            logging.error("Unable to save report: {}".format(e))
         except:
-            logging.warning("Unable to save report")
+            logging.exception("Unable to save report")  # with the traceback, so that the cause is in the log
         else:
             logging.info("Successfully created report")
 